@@ -1,28 +1,169 @@
 #!/usr/bin/python3
 
-import sys
+import argparse
+import os
 from logic import *
-from ground import groundmodel
-from model2logic import model2logic,transition2logic
+from ground import groundmodel,eliminatestatic
+from model2logic import transition2logic,localtransition2logic,localtransition2conjuncts,changingVars
 from specparser import parseinputfile
+from images import CURRENT,NEXT,MonolithicImage,PartitionedImage,FrameImage,ConjunctiveImage,conjunction,\
+    transitionPredecessors,transitionSuccessors,member,restrict
 
 #import dd.cudd as _bdd
 from dd import autoref as _bdd
 
-def reachability(source,target,transitions,allstatevars):
+# Layers of the breadth-first search, needed for trace extraction.
+# They are kept in a dictionary, or if 'directory' is given, each
+# layer is written to a file there and read back only when needed.
+
+class Layers:
+    def __init__(self,bdd,directory):
+        self.bdd = bdd
+        self.directory = directory
+        self.layers = {}
+        if directory is not None:
+            os.makedirs(directory,exist_ok=True)
+
+    def filename(self,i):
+        return os.path.join(self.directory,"layer" + str(i) + ".json")
+
+    def store(self,i,b):
+        if self.directory is None:
+            self.layers[i] = b
+        else:
+            self.bdd.dump(self.filename(i),[b])
+
+    def get(self,i):
+        if self.directory is None:
+            return self.layers[i]
+        b, = self.bdd.load(self.filename(i),levels=False)
+        return b
+
+# Symbolic breadth-first search from the states 'start', forward with
+# images, or backward with preimages.
+# The states reached first after i steps form the frontier F[i], and
+# all states reached in at most i steps are S[i]. Without 'frontier'
+# the image of S[i] is computed at every step. With 'frontier' the
+# image of F[i] = S[i] \ S[i-1] is computed instead, as the image of
+# S[i-1] is already in S[i]. Any set between F[i] and S[i] will do,
+# so the smaller BDD of F[i] and S[i] is used. If 'restrict' is given,
+# F[i] simplified with it with S[i-1] as the don't-care set is a third
+# candidate. This often is smaller, but the simplification may take
+# longer than it saves in the image computation.
+# For trace extraction, only layer i-1 is needed for each i: S[i-1],
+# or F[i-1] with 'frontier'. These layers are kept in 'layers'.
+
+class Search:
+    def __init__(self,bdd,images,start,backward,frontier,restrict,layers):
+        self.bdd = bdd
+        self.images = images
+        self.backward = backward
+        self.frontier = frontier
+        self.restrict = restrict
+        self.layers = layers
+        self.S = start
+        self.F = start
+        self.previousS = bdd.false
+        self.i = 0
+        layers.store(0,start)
+
+    def step(self):
+        bdd = self.bdd
+        # All states reachable from S[i], or from F[i], by one step
+        if not self.frontier:
+            states = self.S
+        elif self.i > 0:
+            candidates = [self.F,self.S]
+            if self.restrict is not None:
+                candidates.append(self.restrict(self.F,~self.previousS))
+            states = min(candidates,key=len)
+        else:
+            states = self.F
+        # The image is computed with bdd.let for applying the renaming
+        # new2old to a BDD, bdd.exist for Existential Abstraction, and
+        # bdd.apply for the Apply operation for doing conjunction/and
+        # (see images.py)
+        if self.backward:
+            newstates = self.images.preimage(states)
+        else:
+            newstates = self.images.image(states)
+        # F[i+1] = newstates \ S[i] and S[i+1] = S[i] U newstates
+        self.previousS = self.S
+        self.F = bdd.apply('and',newstates,~self.S)
+        self.S = bdd.apply('or',self.S,newstates)
+        self.i = self.i + 1
+        self.layers.store(self.i,self.F if self.frontier else self.S)
+
+    # Extract the names of the transitions of a path between the start
+    # states and the state s in layer i. For the forward search, find a
+    # transition from a state in layer i-1 to s, then continue from
+    # that state, and so on. For the backward search, the path goes from
+    # s to the start states, and each step is to a successor in layer
+    # i-1. Only single states are handled, so that no BDD operations
+    # on the layers are needed other than testing membership.
+    # Every transition is given as a list of BDDs whose conjunction
+    # it is.
+
+    def trace(self,transitions,s):
+        bdd = self.bdd
+        sequence = []
+        i = self.i
+        while i>0:
+            previous = self.layers.get(i-1)
+            for n,ts,changing in transitions:
+                if self.backward:
+                    candidates = transitionSuccessors(bdd,ts,changing,s)
+                else:
+                    candidates = transitionPredecessors(bdd,ts,changing,s)
+                found = next((p for p in candidates if member(bdd,p,previous)),None)
+                if found is not None:
+                    sequence.append(n)
+                    s = found
+                    break
+            i = i-1
+        if self.backward:
+            return sequence
+        return list(reversed(sequence))
+
+# The search in a direction that is not used: no steps, and an empty
+# sequence of transitions.
+
+class NoSearch:
+    def __init__(self):
+        self.i = 0
+
+    def trace(self,transitions,s):
+        return []
+
+# Symbolic reachability from the source to the target states.
+# 'imagemode' is either
+#   'monolithic'  : one BDD for the whole transition relation
+#   'partitioned' : clusters of transitions, with BDDs of at most
+#                   'clustersize' nodes (see images.py), by default 1000
+#   'frame'       : transitions without the inertia formulas for the
+#                   variables they do not change
+#   'conjunctive' : transitions as conjunctions of their condition and
+#                   effects, in clusters of at most 'clustersize' nodes,
+#                   with early quantification. By default every conjunct
+#                   is a cluster of its own, as the whole transition
+#                   usually is within any larger size, leaving nothing
+#                   to quantify before the last cluster.
+# 'direction' is 'forward', 'backward' or 'bidirectional' (see Search.)
+# With 'frontier', images are computed only for the newly reached states,
+# which with 'restrictfrontier' are first simplified with restrict,
+# and with 'checkpoint' the layers of the search are written to files
+# in that directory instead of keeping them in memory.
+
+def reachability(source,target,transitions,allstatevars,imagemode='monolithic',clustersize=None,frontier=False,checkpoint=None,direction='forward',restrictfrontier=False):
+
+    if clustersize is None:
+        clustersize = 0 if imagemode == 'conjunctive' else 1000
 
     # Create a BDD
 
     bdd = _bdd.BDD()
     # bdd.configure(reordering=True)
 
-    # Names for the current and next state variables
-
-    def CURRENT(v):
-        return v
-    def NEXT(v):
-        return v + "'"
-
     # All current and next state variables
 
     oldvars = [ CURRENT(v) for v in allstatevars ]
@@ -60,20 +201,19 @@ def reachability(source,target,transitions,allstatevars):
     _bdd.reorder(bdd,list_to_dict(goodorder))
 #    _bdd.reorder(bdd,list_to_dict(badorder))
 
-    # Create mappings x => x' and x' => x (needed for image operations)
-    
-    old2new = {}
-    new2old = {}
-
-    for v in allstatevars:
-        old2new[CURRENT(v)] = NEXT(v)
-        new2old[NEXT(v)] = CURRENT(v)
-
-    # Translate all transitions into logic and further to BDDs
+    # Translate all transitions into logic and further to BDDs.
+    # Keep the name and the variables changed by the transition, which
+    # are all variables if the formula has inertia for the unchanged ones.
+    # The formula is given as a list of conjuncts, which has more than
+    # one element only for the conjunctive partitioning.
 
     def trans2logic(t):
         n,c,e = t
-        return (n,transition2logic(t,allstatevars)) # Keep name
+        if imagemode == 'frame':
+            return (n,[localtransition2logic(t)],changingVars(t))
+        if imagemode == 'conjunctive':
+            return (n,localtransition2conjuncts(t),changingVars(t))
+        return (n,[transition2logic(t,allstatevars)],allstatevars)
 
     transfmas = [ trans2logic(t) for t in transitions ]
 
@@ -95,14 +235,27 @@ def reachability(source,target,transitions,allstatevars):
 
     print("Constructing BDD for the transition relation")
 
-    transitionbdds = [ (n,f.atommap(atom4bdd).makeBDD(bdd)) for n,f in transfmas ]
+    transitionconjuncts = [ (n,[ f.atommap(atom4bdd).makeBDD(bdd) for f in fs ],changing) for n,fs,changing in transfmas ]
 
-    # Build BDD for the relation for all transitions
+    # Build the image operator for the relation for all transitions.
+    # The conjunctive partitioning never constructs the BDD of a whole
+    # transition, and transition sequences are extracted from its
+    # clusters.
 
-    transrelation = model2logic(source,target,transitions,allstatevars)
-    transbdd = transrelation.atommap(atom4bdd).makeBDD(bdd)
+    if imagemode == 'conjunctive':
+        images = ConjunctiveImage(bdd,allstatevars,transitionconjuncts,clustersize,getattr(_bdd,'and_exists',None))
+        tracetransitions = images.transitions
+    else:
+        transitionbdds = [ (n,conjunction(bdd,cs),changing) for n,cs,changing in transitionconjuncts ]
+        if imagemode == 'monolithic':
+            images = MonolithicImage(bdd,allstatevars,transitionbdds)
+        elif imagemode == 'frame':
+            images = FrameImage(bdd,allstatevars,transitionbdds)
+        else:
+            images = PartitionedImage(bdd,allstatevars,transitionbdds,clustersize)
+        tracetransitions = [ (n,[t],changing) for n,t,changing in transitionbdds ]
 
-    print("Transition relation completed: size " + str(len(transbdd)))
+    print("Transition relation completed: " + images.describe())
     
     # Build formula for the initial state.
     # This is either
@@ -121,55 +274,121 @@ def reachability(source,target,transitions,allstatevars):
 
     initialbdd = initialfma.makeBDD(bdd)
 
-    # Symbolic breadth-first search
-    
-    S = {}
-    previousS = bdd.false
-    S[0] = initialbdd
-    i = 0
-    while S[i] != previousS and bdd.apply('and',targetbdd,S[i]) == bdd.false:
-        print("Reachability by " + str(i+1) + " transitions: ", end='')
-        # All states reachable from S[i] by one step
-        newstates = bdd.let(new2old,bdd.exist(oldvars,bdd.apply('and',transbdd,S[i])))
-        # Above, bdd.let is for applying the renaming new2old to a BDD,
-        #        bdd.exist is for Existential Abstraction
-        #        bdd.apply is the Apply operation for doing conjunction/and
-        # S[i+1] = S[i] U newstates
-        S[i+1] = bdd.apply('or',S[i],newstates)
-        print(str(S[i+1].count(nvars = len(allstatevars))) + " states with BDD size " + str(len(S[i+1])))
-        previousS = S[i]
-        i = i + 1
+    # Symbolic breadth-first search forward from the initial states,
+    # backward from the target states, or in both directions (see Search.)
+
+    # The restrict of the BDD package if it has one (dd.cudd does),
+    # otherwise the one in images.py (for dd.autoref)
+
+    if not restrictfrontier:
+        simplify = None
+    elif hasattr(_bdd,'restrict'):
+        simplify = _bdd.restrict
+    else:
+        simplify = lambda f,c: restrict(bdd,f,c)
+
+    def layersFor(name):
+        if checkpoint is None:
+            return Layers(bdd,None)
+        return Layers(bdd,os.path.join(checkpoint,name))
+
+    # Only the searches in the directions used are created, so that no
+    # layers are stored for the other one.
+
+    if direction == 'backward':
+        fwd = NoSearch()
+    else:
+        fwd = Search(bdd,images,initialbdd,False,frontier,simplify,layersFor("forward"))
+    if direction == 'forward':
+        bwd = NoSearch()
+    else:
+        bwd = Search(bdd,images,targetbdd,True,frontier,simplify,layersFor("backward"))
+
+    def report(search):
+        if search.backward:
+            print("Backward reachability by " + str(search.i) + " transitions: ", end='')
+        else:
+            print("Reachability by " + str(search.i) + " transitions: ", end='')
+        print(str(search.S.count(nvars = len(allstatevars))) + " states with BDD size " + str(len(search.S)), end='')
+        if frontier:
+            print(" (frontier BDD size " + str(len(search.F)) + ")",end='')
+        print()
+
+    # Forward search until the target states, backward search until the
+    # initial states, or alternate between the two, taking a step with
+    # the one with the smaller frontier, until they meet.
+
+    if direction == 'forward':
+        searches = [fwd]
+    elif direction == 'backward':
+        searches = [bwd]
+    else:
+        searches = [fwd,bwd]
+
+    def goal(search):
+        if direction == 'forward':
+            return targetbdd
+        if direction == 'backward':
+            return initialbdd
+        return bwd.S if search is fwd else fwd.S
+
+    search = searches[0]
+    meeting = bdd.apply('and',initialbdd,targetbdd)
+    while meeting == bdd.false and all([ s.F != bdd.false for s in searches ]):
+        search = min(searches,key=(lambda s : len(s.F)))
+        search.step()
+        report(search)
+        meeting = bdd.apply('and',search.F,goal(search))
     # Search ends: target reached, or, all states reached
-    if S[i] == previousS:
+    if meeting == bdd.false:
         print("Target states not reachable")
-    else:
-        print("Target states reached by " + str(i) + " steps:")
-        # Extract transition sequence names
-        T = bdd.let(old2new,bdd.apply('and',S[i],targetbdd))
-        sequence = []
-        while i>0:
-            # Find transition from S[i-1] to T
-            for nt in transitionbdds:
-                n,t = nt
-                R = bdd.apply('and',bdd.apply('and',T,t),S[i-1])
-                if R != bdd.false:
-                    sequence = [n] + sequence
-                    T = bdd.let(old2new,bdd.exist(newvars,R))
-                    break
-            i = i-1
-        for s in sequence:
-            print(s)
+        return
+
+    # Pick one state in the meeting point. In the bidirectional search
+    # it must be in the first layer of the other search that meets it.
+    # The transition sequences from the initial states to it and from it
+    # to the target states are then extracted from the layers.
+
+    if direction == 'bidirectional':
+        other = bwd if search is fwd else fwd
+        j = 0
+        while bdd.apply('and',meeting,other.layers.get(j)) == bdd.false:
+            j = j + 1
+        meeting = bdd.apply('and',meeting,other.layers.get(j))
+        other.i = j
+    state = bdd.pick(meeting,care_vars=set(images.oldvars))
+    print("Target states reached by " + str(fwd.i + bwd.i) + " steps:")
+    sequence = fwd.trace(tracetransitions,state) + bwd.trace(tracetransitions,state)
+    for s in sequence:
+        print(s)
 
 # Main procedure for reading the input file and calling reachability
 def main():
-    if len(sys.argv) != 2:
-        print("Must give exactly one argument [file]")
-        exit(1)
-    args = sys.argv
-    filename = args[1]
+    parser = argparse.ArgumentParser(description="BDD-based reachability analysis")
+    parser.add_argument("file",help="specification file")
+    parser.add_argument("--image",choices=["monolithic","partitioned","frame","conjunctive"],default="monolithic",
+                        help="one BDD for the transition relation, clusters of transitions, transitions without inertia, or conjunctively partitioned transitions")
+    parser.add_argument("--cluster",type=int,
+                        help="maximum BDD size of a cluster of transitions or conjuncts (0: no clustering; default 1000 for partitioned, 0 for conjunctive)")
+    parser.add_argument("--frontier",action="store_true",
+                        help="compute images of the newly reached states only")
+    parser.add_argument("--restrict",action="store_true",
+                        help="with --frontier, simplify the newly reached states with restrict")
+    parser.add_argument("--checkpoint",metavar="DIR",
+                        help="write the layers of the search to files in DIR")
+    parser.add_argument("--direction",choices=["forward","backward","bidirectional"],default="forward",
+                        help="search from the initial states, from the target states, or from both")
+    parser.add_argument("--relaxed",action="store_true",
+                        help="remove transitions and state variables by relaxed reachability during grounding")
+    parser.add_argument("--eliminate-static",action="store_true",
+                        help="replace the state variables that no transition changes by their initial values")
+    args = parser.parse_args()
+    filename = args.file
     print("Input file: " + filename)
     source,target,transitions = parseinputfile(filename)
-    gsource,gtarget,gtransitions,allstatevars = groundmodel(source,target,transitions)
-    reachability(gsource,gtarget,gtransitions,allstatevars)
+    gsource,gtarget,gtransitions,allstatevars = groundmodel(source,target,transitions,args.relaxed)
+    if args.eliminate_static:
+        gsource,gtarget,gtransitions,allstatevars = eliminatestatic(gsource,gtarget,gtransitions,allstatevars)
+    reachability(gsource,gtarget,gtransitions,allstatevars,args.image,args.cluster,args.frontier,args.checkpoint,args.direction,args.restrict)
 
 main()
@@ -3,6 +3,7 @@
 # Grounding of parametric transitions
 #
 
+import itertools
 from logic import *
 
 # Given a transition system, and "ground" it, that is,
@@ -12,16 +13,14 @@ from logic import *
 # Consider an transition/action with parameters x : {a,b}, y : {c,d}.
 # We need to create all possible value combinations for x and y,
 # and these are represented by the four variable bindings
-# [ (x,a), (y,c) ]
-# [ (x,a), (y,d) ]
-# [ (x,b), (y,c) ]
-# [ (x,b), (y,d) ]
-# The function doallassignments takes the first parameter
-# binds it in all possible ways (e.g. x is bound to 'a' and 'b'),
-# and recursively calls itself for each of these cases, until
-# all variables are bound. The bottom of the recursion is
-# when there are no parameters left to bind, and the 'bindings'
-# variable includes every parameter with one value.
+# { x : a, y : c }
+# { x : a, y : d }
+# { x : b, y : c }
+# { x : b, y : d }
+# The function allbindings goes through the Cartesian product of
+# the sets of values of the parameters with itertools.product, and
+# generates the bindings one by one, so that the time needed is linear
+# in the number of the bindings.
 
 # Instantiate a term for given variable bindings
 # Terms are either
@@ -30,20 +29,12 @@ from logic import *
 #   numeric expressions that refer to variables in the bindings
 
 def instantiateterm(t,bindings):
-    for e in bindings:
-        k,v = e
-        if k==t:
-            return str(v) # It is a bound variable
-    if isinstance(t,str): # It is a constant symbol
+    if isinstance(t,str): # A bound variable or a constant symbol
+        if t in bindings:
+            return str(bindings[t])
         return t
     # Otherwise it is a numeric expression
-    def V(x):
-        for e in bindings:
-            k,v = e
-            if k==x:
-                return v # It is a bound variable
-        return x # It is a constant symbol
-    return str(t.eval(V)) # Evaluate the expression
+    return str(t.eval(lambda x : bindings.get(x,x))) # Evaluate the expression
     
 # Instantiate an atom for given variable bindings
 # Atoms are pairs (pred,termlist)
@@ -52,8 +43,7 @@ def instantiateatom(a,bindings):
     pred,termlist = a
     if len(termlist) == 0:
         return pred
-    itermlist = map( (lambda t : instantiateterm(t,bindings)) ,termlist)
-    return pred + "_" + '_'.join(itermlist)
+    return pred + "_" + '_'.join([ instantiateterm(t,bindings) for t in termlist ])
 
 # Instantiate a formula for given variable bindings
 
@@ -76,23 +66,26 @@ def instantiateeffs(ee,bindings):
 def makeName(actionname,bindings):
     if len(bindings) == 0:
         return actionname
-    return actionname + "_" + '_'.join([ str(b[1]) for b in bindings ])
+    return actionname + "_" + '_'.join([ str(v) for v in bindings.values() ])
 
-# Go through all variable bindings
+# Generate all variable bindings for the parameters
 
-def doallassignments(actionname,params,precon,effect,bindings):
-    if params == []:
-        return [(makeName(actionname,bindings),instantiatefma(precon,bindings),instantiateeffs(effect,bindings))]
-    param,*params2 = params
-    var,values = param
-    result = [ doallassignments(actionname,params2,precon,effect,bindings + [(var,val)]) for val in values ]
-    return sum(result,[])
+def allbindings(params):
+    names = [ var for var,values in params ]
+    for values in itertools.product(*[ values for var,values in params ]):
+        yield dict(zip(names,values))
 
-# Ground one action
+# Ground one action, generating its instances one by one.
+# The bindings are updated in place, so that the same function M
+# for instantiating the atoms of the condition is used for all instances.
 
 def groundaction(a):
     actionname,params,precon,effect = a
-    return doallassignments(actionname,params,precon,effect,list())
+    bindings = {}
+    M = (lambda x : AT(instantiateatom(x,bindings)))
+    for b in allbindings(params):
+        bindings.update(b)
+        yield (makeName(actionname,bindings),precon.atommap(M),instantiateeffs(effect,bindings))
 
 # Show effect
 
@@ -118,18 +111,58 @@ def actionVars(g):
     n,c,e = g
     return c.vars().union({ varInEffect(a) for a in e })
 
+# Relaxed reachability: ignoring that an effect x := 1 makes x false
+# impossible and x := 0 makes x true impossible, find which state
+# variables can ever be true (P) and which can ever be false (N), and
+# which transitions can ever be taken. This is a fixpoint computation,
+# starting from the initial state given as the list 'source' of the
+# state variables that are true, and it over-approximates the
+# reachable states. The transitions that are never possible are
+# removed. A variable that is never true, or never false, has the
+# same value in all reachable states: it is substituted in the
+# conditions and the target, and its effects are removed.
+
+def relaxedreachability(source,target,actions):
+    allvars = target.vars().union({ v for g in actions for v in actionVars(g)},source)
+    P = set(source)
+    N = allvars.difference(source)
+    possible = [ False for g in actions ]
+    changed = True
+    while changed:
+        changed = False
+        for i,(n,c,e) in enumerate(actions):
+            if not possible[i] and c.possible(P,N)[0]:
+                possible[i] = True
+                changed = True
+                for x,tval in e:
+                    if tval == 1:
+                        P.add(x)
+                    else:
+                        N.add(x)
+    values = { x : (x in P) for x in allvars if x not in P or x not in N }
+    relevant = [ (n,c.simplify(values),[ (x,tval) for x,tval in e if x not in values ])
+                 for i,(n,c,e) in enumerate(actions) if possible[i] ]
+    print("RELAXED REACHABILITY: " + str(len(relevant)) + " of " + str(len(actions)) + " transitions possible, " +
+          str(len(values)) + " state variables with a constant value")
+    return ([ x for x in source if x not in values ],target.simplify(values),relevant)
+
 # Ground a transition system description, with parameterized transition
-# rules mapped to ground/unparameterized rules.
+# rules mapped to ground/unparameterized rules. With 'relaxed', the
+# transitions and state variables are pruned with relaxedreachability,
+# if the initial state is given as a list of state variables.
 
-def groundmodel(source,target,actions):
-    groundtarget = instantiatefma(target,list())
+def groundmodel(source,target,actions,relaxed=False):
+    groundtarget = instantiatefma(target,dict())
     groundactions = [ g for a in actions for g in groundaction(a) ]
+    if relaxed and isinstance(source,list):
+        relaxedsource = [ instantiateatom(x,dict()) for x in source ]
+        relaxedsource,groundtarget,groundactions = relaxedreachability(relaxedsource,groundtarget,groundactions)
     allvars0 = groundtarget.vars().union({ v for g in groundactions for v in actionVars(g)})
     if isinstance(source,list):
-        groundsource = [ instantiateatom(x,list()) for x in source ]
+        groundsource = relaxedsource if relaxed else [ instantiateatom(x,dict()) for x in source ]
         allvars = allvars0.union({ x for x in groundsource})
     else:
-        groundsource = instantiatefma(source,list())
+        groundsource = instantiatefma(source,dict())
         allvars = allvars0.union(groundsource.vars())
     print("ALL STATE VARIABLES: " + ' '.join(sorted(allvars)))
     print("GROUNDED ACTIONS:")
@@ -145,3 +178,29 @@ def groundmodel(source,target,actions):
     print("GROUNDED TARGET:")
     print(groundtarget)
     return (groundsource,groundtarget,groundactions,allvars)
+
+# Static state variables are those that no effect of any transition
+# changes. If the initial state is given as the list of the state
+# variables that are true, the value of a static variable is the same
+# in every reachable state, and it can be substituted in the conditions
+# of the transitions and in the target. Transitions with a condition
+# that becomes FALSE can never be taken, and they are removed. This may
+# make more variables static, so this is repeated until nothing changes.
+
+def eliminatestatic(source,target,actions,allvars):
+    if not isinstance(source,list):
+        return (source,target,actions,allvars)
+    static = set()
+    while True:
+        changing = { varInEffect(e) for n,c,eff in actions for e in eff }
+        newstatic = allvars.difference(changing)
+        if newstatic == static:
+            break
+        static = newstatic
+        values = { v : (v in source) for v in static }
+        actions = [ (n,c.simplify(values),e) for n,c,e in actions ]
+        actions = [ (n,c,e) for n,c,e in actions if not isinstance(c,FALSE) ]
+    values = { v : (v in source) for v in static }
+    print("STATIC STATE VARIABLES: " + ' '.join(sorted(static)))
+    print("TRANSITIONS AFTER REMOVING STATIC STATE VARIABLES: " + str(len(actions)))
+    return ([ v for v in source if v not in static ],target.simplify(values),actions,allvars.difference(static))
@@ -0,0 +1,348 @@
+#
+# Image computation for BDD-based reachability
+#
+
+# The image of a set S of states, represented as a BDD over the current
+# state variables x, is the set of states reachable from S by one
+# transition. With T(x,x') the transition relation, it is
+#
+#   IMAGE(S) = (EXIST x. S(x) and T(x,x'))[x'/x]
+#
+# that is, the conjunction of S and T, with the current state variables
+# abstracted away, and the next state variables renamed back to x.
+
+# Names for the current and next state variables
+
+def CURRENT(v):
+    return v
+def NEXT(v):
+    return v + "'"
+
+# Disjunction of a list of BDDs
+
+def disjunction(bdd,bdds):
+    result = bdd.false
+    for b in bdds:
+        result = bdd.apply('or',result,b)
+    return result
+
+# Conjunction of a list of BDDs
+
+def conjunction(bdd,bdds):
+    result = bdd.true
+    for b in bdds:
+        result = bdd.apply('and',result,b)
+    return result
+
+# Common parts of all image operators: the mappings x => x' and x' => x,
+# and the lists of the current and next state variables.
+
+class Image:
+    def __init__(self,bdd,allstatevars):
+        self.bdd = bdd
+        self.oldvars = [ CURRENT(v) for v in allstatevars ]
+        self.newvars = [ NEXT(v) for v in allstatevars ]
+        self.old2new = { CURRENT(v) : NEXT(v) for v in allstatevars }
+        self.new2old = { NEXT(v) : CURRENT(v) for v in allstatevars }
+
+    # Image with respect to the relation T
+
+    def relationImage(self,T,S):
+        bdd = self.bdd
+        return bdd.let(self.new2old,bdd.exist(self.oldvars,bdd.apply('and',T,S)))
+
+    # Preimage with respect to the relation T: the states from which
+    # a state in S is reachable by one transition
+
+    def relationPreimage(self,T,S):
+        bdd = self.bdd
+        return bdd.exist(self.newvars,bdd.apply('and',T,bdd.let(self.old2new,S)))
+
+# Predecessors of the states T by the transition with BDD t and
+# changing variables 'changing'. Only the changing variables are
+# renamed to x' in T. The remaining variables of T then constrain
+# the current state, as they have the same value in both states.
+# For a transition with inertia formulas for all unchanging variables,
+# 'changing' is simply all state variables.
+
+def transitionPreimage(bdd,t,changing,T):
+    rename = { CURRENT(v) : NEXT(v) for v in changing }
+    return bdd.exist([ NEXT(v) for v in changing ],bdd.apply('and',t,bdd.let(rename,T)))
+
+# Predecessors and successors of one state s, which is a dictionary
+# mapping all current state variables to True or False, by the
+# transition that is the conjunction of the BDDs 'ts' and has the
+# changing variables 'changing'. The values of s are substituted in
+# each BDD, which leaves BDDs over the changing variables only (in the
+# current state for predecessors and in the next state for successors),
+# and the valuations of their conjunction together with the values of
+# the unchanging variables in s are the predecessors or successors.
+# With deterministic effects there are very few of them.
+
+def transitionPredecessors(bdd,ts,changing,s):
+    values = { NEXT(v) : s[CURRENT(v)] for v in changing }
+    for t in ts:
+        for x in bdd.support(t):
+            if x in s and x not in changing:
+                values[x] = s[x]
+    C = conjunction(bdd,[ bdd.let(values,t) for t in ts ])
+    for p in bdd.pick_iter(C,care_vars={ CURRENT(v) for v in changing }):
+        yield dict(s,**p)
+
+def transitionSuccessors(bdd,ts,changing,s):
+    C = conjunction(bdd,[ bdd.let({ x : s[x] for x in bdd.support(t) if x in s },t) for t in ts ])
+    for q in bdd.pick_iter(C,care_vars={ NEXT(v) for v in changing }):
+        yield dict(s,**{ CURRENT(v) : q[NEXT(v)] for v in changing })
+
+# Is the state s in the set of states B? With all variables assigned,
+# this only follows one path in B.
+
+def member(bdd,s,B):
+    return bdd.let(s,B) == bdd.true
+
+# Simplification of f with the care set c (restrict of Coudert and
+# Madre): a BDD that agrees with f on c, and is usually smaller than f.
+# Where the top variable of f has one cofactor of c false, the other
+# cofactor of f is taken, and variables of c above the top variable
+# of f are quantified away from c. This is for BDD packages such as
+# dd.autoref that do not provide restrict, and works directly on the
+# nodes, whose low and high edges are those of the regular node.
+
+def restrict(bdd,f,c):
+    return restrictRec(bdd,f,c,bdd.true,bdd.false,{})
+
+def cofactors(u,level):
+    if u.level != level:
+        return u,u
+    if u.negated:
+        return ~u.high,~u.low
+    return u.high,u.low
+
+def restrictRec(bdd,f,c,true,false,computed):
+    if c == false:
+        return false
+    if c == true or f == true or f == false:
+        return f
+    if f == c:
+        return true
+    if f.node == -c.node:
+        return false
+    if (f,c) in computed:
+        return computed[(f,c)]
+    if c.level < f.level:
+        c1,c0 = cofactors(c,c.level)
+        result = restrictRec(bdd,f,c1 | c0,true,false,computed)
+    else:
+        f1,f0 = cofactors(f,f.level)
+        c1,c0 = cofactors(c,f.level)
+        if c1 == false:
+            result = restrictRec(bdd,f0,c0,true,false,computed)
+        elif c0 == false:
+            result = restrictRec(bdd,f1,c1,true,false,computed)
+        else:
+            result = bdd.find_or_add(f.var,
+                                     restrictRec(bdd,f0,c0,true,false,computed),
+                                     restrictRec(bdd,f1,c1,true,false,computed))
+    computed[(f,c)] = result
+    return result
+
+# The transition relation as one BDD, the disjunction of the BDDs
+# of all transitions.
+
+class MonolithicImage(Image):
+    def __init__(self,bdd,allstatevars,transitionbdds):
+        Image.__init__(self,bdd,allstatevars)
+        self.transbdd = disjunction(bdd,[ t for n,t,changing in transitionbdds ])
+
+    def image(self,S):
+        return self.relationImage(self.transbdd,S)
+
+    def preimage(self,S):
+        return self.relationPreimage(self.transbdd,S)
+
+    def describe(self):
+        return "size " + str(len(self.transbdd))
+
+# Disjunctively partitioned transition relation. The transitions are
+# grouped into clusters, each represented by the disjunction of the BDDs
+# of its transitions, and the image is the union of the images of the
+# clusters. A transition is added to the current cluster as long as
+# the BDD of the cluster stays within 'clustersize' nodes. With
+# clustersize 0 every transition is a cluster of its own. The BDD of
+# the whole transition relation is never constructed.
+
+class PartitionedImage(Image):
+    def __init__(self,bdd,allstatevars,transitionbdds,clustersize):
+        Image.__init__(self,bdd,allstatevars)
+        self.clusters = []
+        current = None
+        for n,t,changing in transitionbdds:
+            if current is not None:
+                merged = bdd.apply('or',current,t)
+                if len(merged) <= clustersize:
+                    current = merged
+                    continue
+                self.clusters.append(current)
+            current = t
+        if current is not None:
+            self.clusters.append(current)
+
+    def image(self,S):
+        return disjunction(self.bdd,[ self.relationImage(T,S) for T in self.clusters ])
+
+    def preimage(self,S):
+        return disjunction(self.bdd,[ self.relationPreimage(T,S) for T in self.clusters ])
+
+    def describe(self):
+        return str(len(self.clusters)) + " clusters of total size " + str(sum([ len(T) for T in self.clusters ]))
+
+# Conjunctively partitioned transitions with early quantification.
+# Every transition is the conjunction of its condition and effects
+# (see localtransition2conjuncts in model2logic.py), and the image by
+# it is computed as
+#
+#   EXIST Q_k. C_k and ... (EXIST Q_2. C_2 and (EXIST Q_1. C_1 and S))
+#
+# without ever constructing the BDD of the whole transition. The
+# inertia x <-> x' of a variable the transition does not change is not
+# a conjunct: conjoining it and quantifying x renames x to x', which
+# the final renaming of x' to x undoes, so these variables are left as
+# they are in S, as in FrameImage. Only the changing variables are
+# quantified and renamed.
+#
+# The conjuncts are ordered, and consecutive ones are merged into
+# clusters C_1,...,C_k with BDDs of at most 'clustersize' nodes
+# (0: one cluster for each conjunct). Each changing current state
+# variable is quantified as soon as no remaining cluster refers to it:
+# Q_j has the variables in C_j but in none of C_j+1,...,C_k. The
+# variables that are in no cluster are quantified together with Q_1,
+# as S is largest before the conjunction with C_1. Preimages are
+# computed in the same way, with the clusters in the same order, and
+# the changing next state variables quantified instead.
+#
+# The order of the conjuncts is chosen greedily as in IWLS95: next comes
+# the conjunct that allows the most variables to be quantified, that is,
+# has the most variables that no other remaining conjunct refers to,
+# with ties broken by the smallest number of next state variables
+# introduced. The number of remaining conjuncts that refer to each
+# variable is updated as the conjuncts are chosen.
+#
+# 'transitions' has the name, the clusters and the changing variables
+# of every transition, for trace extraction.
+#
+# 'andexists' is a function computing EXIST Q. A and B in one pass
+# (e.g. and_exists in dd.cudd), or None.
+
+class ConjunctiveImage(Image):
+    def __init__(self,bdd,allstatevars,transitionconjuncts,clustersize,andexists=None):
+        Image.__init__(self,bdd,allstatevars)
+        self.andexists = andexists
+        self.transitions = []
+        self.schedules = []
+        for n,conjuncts,changing in transitionconjuncts:
+            clusters,schedule = self.schedule(conjuncts,changing,clustersize)
+            self.transitions.append((n,clusters,changing))
+            self.schedules.append(schedule)
+
+    # Order the conjuncts and compute the clusters and their variables
+    # to quantify
+
+    def schedule(self,conjuncts,changing,clustersize):
+        bdd = self.bdd
+        oldvars = { CURRENT(v) for v in changing }
+        newvars = { NEXT(v) for v in changing }
+        supports = [ bdd.support(c) for c in conjuncts ]
+        occurrences = { x : 0 for x in oldvars }
+        for support in supports:
+            for x in support.intersection(oldvars):
+                occurrences[x] = occurrences[x] + 1
+
+        def score(j):
+            support = supports[j]
+            return (len([ x for x in support.intersection(oldvars) if occurrences[x] == 1 ]),-len(support.intersection(newvars)))
+
+        remaining = list(range(len(conjuncts)))
+        ordered = []
+        while remaining:
+            best = max(remaining,key=score)
+            remaining.remove(best)
+            for x in supports[best].intersection(oldvars):
+                occurrences[x] = occurrences[x] - 1
+            ordered.append(conjuncts[best])
+
+        clusters = []
+        for c in ordered:
+            if clusters:
+                merged = bdd.apply('and',clusters[-1],c)
+                if len(merged) <= clustersize:
+                    clusters[-1] = merged
+                    continue
+            clusters.append(c)
+
+        # The variables to quantify after each cluster
+
+        def quantification(variables):
+            supports = [ bdd.support(c).intersection(variables) for c in clusters ]
+            steps = []
+            for j in range(len(clusters)):
+                later = set().union(*supports[j+1:])
+                steps.append(supports[j].difference(later))
+            if steps:
+                steps[0] = steps[0].union(variables.difference(set().union(*supports)))
+            return list(zip(clusters,[ sorted(Q) for Q in steps ]))
+
+        new2old = { NEXT(v) : CURRENT(v) for v in changing }
+        old2new = { CURRENT(v) : NEXT(v) for v in changing }
+        return (clusters,(new2old,quantification(oldvars),old2new,quantification(newvars)))
+
+    def relationalProduct(self,P,steps):
+        bdd = self.bdd
+        for C,Q in steps:
+            if self.andexists is not None:
+                P = self.andexists(P,C,Q)
+            elif Q:
+                P = bdd.exist(Q,bdd.apply('and',P,C))
+            else:
+                P = bdd.apply('and',P,C)
+        return P
+
+    def image(self,S):
+        bdd = self.bdd
+        return disjunction(bdd,[ bdd.let(new2old,self.relationalProduct(S,steps))
+                                 for new2old,steps,old2new,presteps in self.schedules ])
+
+    def preimage(self,S):
+        bdd = self.bdd
+        return disjunction(bdd,[ self.relationalProduct(bdd.let(old2new,S),presteps)
+                                 for new2old,steps,old2new,presteps in self.schedules ])
+
+    def describe(self):
+        return (str(len(self.transitions)) + " transitions with " + str(sum([ len(clusters) for n,clusters,changing in self.transitions ])) +
+                " clusters of total size " + str(sum([ len(C) for n,clusters,changing in self.transitions for C in clusters ])))
+
+# Image computation with the transitions represented without the
+# inertia formulas x <-> x' for the variables they do not change
+# (see localtransition2logic in model2logic.py), so that each BDD
+# only has the variables of the condition and the effects. The image
+# by one transition abstracts and renames only the changing variables
+# of that transition, and the other variables in S are left as they
+# are. The cost of an image is then proportional to the number of
+# variables the transitions refer to, not the number of all variables.
+
+class FrameImage(Image):
+    def __init__(self,bdd,allstatevars,transitionbdds):
+        Image.__init__(self,bdd,allstatevars)
+        self.transitions = [ (t,[ CURRENT(v) for v in changing ],{ NEXT(v) : CURRENT(v) for v in changing },changing)
+                             for n,t,changing in transitionbdds ]
+
+    def image(self,S):
+        bdd = self.bdd
+        return disjunction(bdd,[ bdd.let(new2old,bdd.exist(oldvars,bdd.apply('and',t,S)))
+                                 for t,oldvars,new2old,changing in self.transitions ])
+
+    def preimage(self,S):
+        return disjunction(self.bdd,[ transitionPreimage(self.bdd,t,changing,S)
+                                      for t,oldvars,new2old,changing in self.transitions ])
+
+    def describe(self):
+        return str(len(self.transitions)) + " transitions of total size " + str(sum([ len(t) for t,o,n,c in self.transitions ]))
@@ -25,6 +25,12 @@ def applyforlist(bddop,formulas,bdd,foremptylist):
 #   vars(self)         Variables occurring in the formula
 #   atommap(self,M)    Formula with every AT(a) replaced by M(a)
 #   makeBDD(self,bdd)  Construct an OBDD from the formula
+#   simplify(self,values)  Formula with the variables in the dictionary
+#                      'values' replaced by their truth values, and
+#                      TRUE and FALSE eliminated where possible
+#   possible(self,P,N) Pair (t,f) telling whether the formula can be
+#                      true and whether it can be false, if the variables
+#                      in P can be true and the variables in N can be false
 #
 
 # AT class represent atomic propositions.
@@ -46,6 +52,14 @@ class AT:
     return M(self.name)
   def makeBDD(self,bdd):
     return bdd.var(self.name)
+  def possible(self,P,N):
+    return (self.name in P,self.name in N)
+  def simplify(self,values):
+    if self.name not in values:
+      return self
+    if values[self.name]:
+      return TRUE()
+    return FALSE()
 
 # Both CONJ and DISJ will inherit __init__ and vars from NaryFormula
 # NaryFormula means formulas with multiple subformulas.
@@ -71,6 +85,19 @@ class CONJ(NaryFormula):
     return CONJ([f.atommap(M) for f in self.subformulas])
   def makeBDD(self,bdd):
     return applyforlist('and',self.subformulas,bdd,bdd.true)
+  def simplify(self,values):
+    fs = [ f.simplify(values) for f in self.subformulas ]
+    if any([ isinstance(f,FALSE) for f in fs ]):
+      return FALSE()
+    fs = [ f for f in fs if not isinstance(f,TRUE) ]
+    if len(fs) == 0:
+      return TRUE()
+    if len(fs) == 1:
+      return fs[0]
+    return CONJ(fs)
+  def possible(self,P,N):
+    ps = [ f.possible(P,N) for f in self.subformulas ]
+    return (all([ t for t,f in ps ]),any([ f for t,f in ps ]))
 
 class DISJ(NaryFormula):
   def __repr__(self):
@@ -82,6 +109,19 @@ class DISJ(NaryFormula):
     return DISJ([f.atommap(M) for f in self.subformulas])
   def makeBDD(self,bdd):
     return applyforlist('or',self.subformulas,bdd,bdd.false)
+  def simplify(self,values):
+    fs = [ f.simplify(values) for f in self.subformulas ]
+    if any([ isinstance(f,TRUE) for f in fs ]):
+      return TRUE()
+    fs = [ f for f in fs if not isinstance(f,FALSE) ]
+    if len(fs) == 0:
+      return FALSE()
+    if len(fs) == 1:
+      return fs[0]
+    return DISJ(fs)
+  def possible(self,P,N):
+    ps = [ f.possible(P,N) for f in self.subformulas ]
+    return (any([ t for t,f in ps ]),all([ f for t,f in ps ]))
 
 class NEG:
   def __init__(self,subformula):
@@ -94,6 +134,16 @@ class NEG:
     return NEG(self.subformula.atommap(M))
   def makeBDD(self,bdd):
     return ~ self.subformula.makeBDD(bdd)
+  def simplify(self,values):
+    f = self.subformula.simplify(values)
+    if isinstance(f,TRUE):
+      return FALSE()
+    if isinstance(f,FALSE):
+      return TRUE()
+    return NEG(f)
+  def possible(self,P,N):
+    t,f = self.subformula.possible(P,N)
+    return (f,t)
 
 class TRUE:
   def __init__(self):
@@ -106,6 +156,10 @@ class TRUE:
     return self
   def makeBDD(self,bdd):
     return bdd.true
+  def simplify(self,values):
+    return self
+  def possible(self,P,N):
+    return (True,False)
 
 class FALSE:
   def __init__(self):
@@ -118,6 +172,10 @@ class FALSE:
     return self
   def makeBDD(self,bdd):
     return bdd.false
+  def simplify(self,values):
+    return self
+  def possible(self,P,N):
+    return (False,True)
 
 # Implication and equivalence reduced to the primitive connectives
 
@@ -63,6 +63,29 @@ def transition2logic(transition,allvars):
     # Formula for the transition
     return CONJ([conditionWithTime] + eformulas + inertia)
 
+# State variables changed by the effects of a transition
+
+def changingVars(transition):
+    actionname,condition,effect = transition
+    return { varInEffect(e) for e in effect }
+
+# Formula for one transition without the inertia formulas, that is,
+# only over the variables in the condition and the effects. The
+# variables not in changingVars(transition) keep their values, but
+# this is left implicit: image computation with this formula
+# abstracts and renames only the changing variables.
+
+def localtransition2logic(transition):
+    return CONJ(localtransition2conjuncts(transition))
+
+# The same as a list of conjuncts: the condition and the effects
+
+def localtransition2conjuncts(transition):
+    actionname,condition,effect = transition
+    conditionWithTime = condition.atommap(ATOMnow)
+    eformulas = [ effect2formula(e) for e in effect ]
+    return [conditionWithTime] + eformulas
+
 # Translate all transitions to logic
 
 def model2logic(source,target,actions,allvars):
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+
+# Benchmarks for the OBDD engine in bddops-template.py
+#
+# Each benchmark family builds OBDDs for a parameterized problem, and
+# for every instance the following is reported:
+#   nodes     : nodes in the unique table at the end
+#   size      : nodes in the OBDD of the result
+#   models    : model-count of the result
+#   seconds   : wall time for constructing the result
+#   peakBytes : peak memory allocated by Python (measured on a second
+#               run with tracemalloc, as tracing slows everything down)
+#   cache     : statistics of the computed table
+# The results are written as JSON, so that runs can be compared.
+#
+# To run all benchmarks and write the results to results.json:
+#
+#   python3 bddbenchmark.py -o results.json
+#
+# and with the larger instances and complemented edges:
+#
+#   python3 bddbenchmark.py --large --complement -o results.json
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import importlib.util
+import os
+
+# The engine file has a '-' in its name, so it is loaded by its path.
+
+def loadEngine():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"bddops-template.py")
+    spec = importlib.util.spec_from_file_location("bddops",path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+engine = loadEngine()
+
+def XOR(B,b1,b2):
+    return B.neg(B.eqvi(b1,b2))
+
+# N-queens: variable q_r_c is true if there is a queen in row r, column c.
+# Every row has a queen, and no two queens attack each other.
+
+def queens(options,n):
+    B = engine.OBDD([ "q_" + str(r) + "_" + str(c) for r in range(n) for c in range(n) ],**options)
+    Q = [ [ B.atom("q_" + str(r) + "_" + str(c)) for c in range(n) ] for r in range(n) ]
+    constraints = [ B.disjs(Q[r]) for r in range(n) ]
+    for r1 in range(n):
+        for c1 in range(n):
+            for r2 in range(r1,n):
+                for c2 in range(n):
+                    if (r2,c2) <= (r1,c1):
+                        continue
+                    if r1 == r2 or c1 == c2 or abs(r1-r2) == abs(c1-c2):
+                        constraints.append(B.disj(B.neg(Q[r1][c1]),B.neg(Q[r2][c2])))
+    return B,B.conjs(constraints)
+
+# Adder equivalence: a ripple-carry adder and a carry-lookahead adder
+# for n-bit numbers a and b compute the same sum bits. The result is
+# the conjunction of the equivalences of the sum bits, which is TRUE.
+
+def adders(options,n):
+    B = engine.OBDD([ x + str(i) for i in range(n) for x in ("a","b") ],**options)
+    a = [ B.atom("a" + str(i)) for i in range(n) ]
+    b = [ B.atom("b" + str(i)) for i in range(n) ]
+
+    ripple = []
+    carry = 0
+    for i in range(n):
+        ripple.append(XOR(B,XOR(B,a[i],b[i]),carry))
+        carry = B.disjs([B.conj(a[i],b[i]),B.conj(a[i],carry),B.conj(b[i],carry)])
+
+    # Carry into bit i: generated at some j < i and propagated by j+1..i-1
+
+    lookahead = []
+    for i in range(n):
+        carry = B.disjs([ B.conjs([B.conj(a[j],b[j])] + [ XOR(B,a[k],b[k]) for k in range(j+1,i) ]) for j in range(i) ])
+        lookahead.append(XOR(B,XOR(B,a[i],b[i]),carry))
+
+    return B,B.conjs([ B.eqvi(s1,s2) for s1,s2 in zip(ripple,lookahead) ])
+
+# The chain X0 <-> Y0, ..., Xn-1 <-> Yn-1, with the variables either
+# interleaved (linear size) or all X before all Y in reverse (exponential.)
+
+def chain(options,n,interleaved):
+    if interleaved:
+        order = [ v + str(i) for i in range(n) for v in ("X","Y") ]
+    else:
+        order = [ "X" + str(i) for i in range(n) ] + [ "Y" + str(i) for i in reversed(range(n)) ]
+    B = engine.OBDD(order,**options)
+    return B,B.conjs([ B.eqvi(B.atom("X" + str(i)),B.atom("Y" + str(i))) for i in range(n) ])
+
+# Random 3-CNF with n variables and ratio*n clauses
+
+def random3cnf(options,n,ratio,seed):
+    rng = random.Random(seed)
+    B = engine.OBDD([ "x" + str(i) for i in range(n) ],**options)
+    clauses = []
+    for k in range(round(ratio * n)):
+        literals = []
+        for i in rng.sample(range(n),3):
+            x = B.atom("x" + str(i))
+            literals.append(x if rng.random() < 0.5 else B.neg(x))
+        clauses.append(B.disjs(literals))
+    return B,B.conjs(clauses)
+
+# The middle output bit (bit n-1) of an n-bit multiplier, which has no
+# small OBDD under any variable ordering.
+
+def multiplier(options,n):
+    B = engine.OBDD([ x + str(i) for i in range(n) for x in ("a","b") ],**options)
+    a = [ B.atom("a" + str(i)) for i in range(n) ]
+    b = [ B.atom("b" + str(i)) for i in range(n) ]
+
+    # Shift-and-add of the partial products, keeping the bits 0..n-1
+
+    product = [0] * n
+    for j in range(n):
+        carry = 0
+        for i in range(n-j):
+            p = B.conj(a[i],b[j])
+            s = product[i+j]
+            product[i+j] = XOR(B,XOR(B,s,p),carry)
+            carry = B.disjs([B.conj(s,p),B.conj(s,carry),B.conj(p,carry)])
+    return B,product[n-1]
+
+# The instances of all families
+
+def instances(large):
+    if large:
+        return ([ ("queens",{ "n" : n }) for n in (4,5,6,7,8) ] +
+                [ ("adders",{ "n" : n }) for n in (8,16,32) ] +
+                [ ("chain",{ "n" : n, "interleaved" : i }) for i in (True,False) for n in (4,8,12,14) ] +
+                [ ("random3cnf",{ "n" : 40, "ratio" : r, "seed" : 1 }) for r in (2.0,3.0,4.26,5.0) ] +
+                [ ("multiplier",{ "n" : n }) for n in (4,6,8,10) ])
+    return ([ ("queens",{ "n" : n }) for n in (4,5,6) ] +
+            [ ("adders",{ "n" : n }) for n in (4,8,16) ] +
+            [ ("chain",{ "n" : n, "interleaved" : i }) for i in (True,False) for n in (4,8,10) ] +
+            [ ("random3cnf",{ "n" : 20, "ratio" : r, "seed" : 1 }) for r in (2.0,3.0,4.26,5.0) ] +
+            [ ("multiplier",{ "n" : n }) for n in (4,6,8) ])
+
+FAMILIES = { "queens" : queens,
+             "adders" : adders,
+             "chain" : chain,
+             "random3cnf" : random3cnf,
+             "multiplier" : multiplier }
+
+# Run one instance: once for time and OBDD statistics, and once more
+# with tracemalloc for the peak memory.
+
+def run(family,params,options,memory):
+    start = time.perf_counter()
+    B,result = FAMILIES[family](options,**params)
+    seconds = time.perf_counter() - start
+    record = { "family" : family,
+               "params" : params,
+               "nodes" : len(B.hash),
+               "size" : B.size(result),
+               "models" : B.countModels(result),
+               "seconds" : seconds,
+               "cache" : B.cacheStats() }
+    if memory:
+        tracemalloc.start()
+        FAMILIES[family](options,**params)
+        record["peakBytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the OBDD engine")
+    parser.add_argument("-o","--output",help="file for the JSON results (default: standard output)")
+    parser.add_argument("--large",action="store_true",help="run the larger instances")
+    parser.add_argument("--family",action="append",choices=sorted(FAMILIES),help="run only this family (can be repeated)")
+    parser.add_argument("--complement",action="store_true",help="use complemented edges")
+    parser.add_argument("--lazy",action="store_true",help="count models lazily")
+    parser.add_argument("--cache",type=int,default=2**18,help="computed table size")
+    parser.add_argument("--policy",default="lru",choices=["lru","fifo","direct"],help="computed table replacement policy")
+    parser.add_argument("--no-memory",action="store_true",help="do not measure peak memory")
+    args = parser.parse_args()
+
+    options = { "complement" : args.complement,
+                "lazyCount" : args.lazy,
+                "cacheSize" : args.cache,
+                "cachePolicy" : args.policy }
+    results = []
+    for family,params in instances(args.large):
+        if args.family and family not in args.family:
+            continue
+        record = run(family,params,options,not args.no_memory)
+        print(family,params,"nodes",record["nodes"],"size",record["size"],"%.3f s" % record["seconds"],file=sys.stderr)
+        results.append(record)
+
+    report = { "python" : platform.python_version(),
+               "options" : options,
+               "results" : results }
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(report,f,indent=1)
+    else:
+        json.dump(report,sys.stdout,indent=1)
+
+if __name__ == "__main__":
+    main()
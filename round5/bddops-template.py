@@ -1,11 +1,37 @@
 
 # OBDD
 
-import math
+from collections import OrderedDict
 
-# This is for the 'reduce' function.
+# Compact arrays for the array-based OBDD
 
-from functools import reduce
+from array import array
+
+# Timing of garbage collection
+
+import time
+
+# Enumeration and sampling of models
+
+import itertools
+import random
+
+# Binary files of OBDDs
+
+import mmap
+import struct
+
+# Breadth-first traversal in the DOT export
+
+from collections import deque
+
+# Priority queue for the 'smallest' schedule of conjs/disjs
+
+import heapq
+
+# Tracing of OBDD operations in a 'with' statement
+
+from contextlib import contextmanager
 
 # Truth-tables for commonly used binary connectives
 
@@ -53,20 +79,285 @@ class OBDDnode():
         self.posChild = posChild
         self.negChild = negChild
         self.modelCount = 0
+        self.complement = None
+
+# Complemented edges
+#
+# In the complement mode of OBDD, the negation of a node is not a new
+# node in the unique table, but a light-weight view 'OBDDcomplement' of
+# the original node, pointing to it with 'regular'. Each node has at
+# most one view, stored in its 'complement' attribute, and the children
+# of the view are the negations of the children of the original node.
+# So negation takes constant time, and a function and its negation
+# share all nodes.
+#
+# The nodes in the unique table are canonical: their positive child
+# is never complemented (it is 1 or a node that is not a view).
+
+class OBDDcomplement(OBDDnode):
+    def __init__(self,regular):
+        self.regular = regular
+
+    @property
+    def nodeVar(self):
+        return self.regular.nodeVar
+
+    @property
+    def posChild(self):
+        return flip(self.regular.posChild)
+
+    @property
+    def negChild(self):
+        return flip(self.regular.negChild)
+
+# Negation of a node by flipping the complement mark of the edge
+
+def flip(b):
+    if isinstance(b,int):
+        return 1-b
+    if isinstance(b,OBDDcomplement):
+        return b.regular
+    if b.complement is None:
+        b.complement = OBDDcomplement(b)
+    return b.complement
+
+# The node without the complement mark
+
+def regular(b):
+    if isinstance(b,OBDDcomplement):
+        return b.regular
+    return b
+
+# Computed table (operation cache) for the APPLY operation.
+#
+# Maps keys (operation,node1,node2) to the result of the operation
+# for the two nodes, so that APPLY over shared sub-DAGs visits each
+# pair of nodes only once. The table holds at most 'size' entries,
+# and the replacement policy determines what is evicted when full:
+#   'lru'    : the least recently used entry
+#   'fifo'   : the oldest inserted entry
+#   'direct' : direct-mapped, each key has one slot determined by its
+#              hash value, and a new entry overwrites the old one
+# A size of 0 disables caching altogether.
+#
+# The cached results refer to OBDD nodes, so the table must be cleared
+# whenever nodes are removed from the unique table. Every clear
+# increments 'version', so that users can detect stale information.
+
+class ComputedTable():
+    def __init__(self,size=2**18,policy='lru'):
+        if policy not in ('lru','fifo','direct'):
+            raise ValueError("Unknown cache replacement policy: " + str(policy))
+        self.size = size
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self.clear()
+
+    # Remove all entries.
+
+    def clear(self):
+        if self.policy == 'direct':
+            self.slots = [None] * self.size
+        elif self.policy == 'lru':
+            self.table = OrderedDict()
+        else:
+            self.table = dict()
+        self.version = self.version + 1
+
+    # Return the cached result for 'key', or None if there is none.
+
+    def lookup(self,key):
+        if self.size == 0:
+            self.misses = self.misses + 1
+            return None
+        if self.policy == 'direct':
+            entry = self.slots[hash(key) % self.size]
+            if entry is not None and entry[0] == key:
+                self.hits = self.hits + 1
+                return entry[1]
+        elif key in self.table:
+            self.hits = self.hits + 1
+            if self.policy == 'lru':
+                self.table.move_to_end(key)
+            return self.table[key]
+        self.misses = self.misses + 1
+        return None
+
+    # Store the result for 'key', evicting an entry if the table is full.
+
+    def insert(self,key,result):
+        if self.size == 0:
+            return
+        if self.policy == 'direct':
+            self.slots[hash(key) % self.size] = (key,result)
+            return
+        if len(self.table) >= self.size:
+            if self.policy == 'lru':
+                self.table.popitem(last=False)
+            else:
+                del self.table[next(iter(self.table))]
+        self.table[key] = result
+
+    # Number of entries currently in the table
+
+    def __len__(self):
+        if self.policy == 'direct':
+            return sum(1 for e in self.slots if e is not None)
+        return len(self.table)
+
+    # Hit and miss counters
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return { "size" : self.size,
+                 "policy" : self.policy,
+                 "entries" : len(self),
+                 "hits" : self.hits,
+                 "misses" : self.misses,
+                 "hitrate" : (self.hits / lookups if lookups > 0 else 0.0),
+                 "version" : self.version }
+
+# Tasks in the explicit stacks that replace recursion in APPLY, ITE,
+# quantification, renaming and cofactoring (see runTasks.)
+
+EXPAND = 0
+BUILD = 1
+BRANCH = 2
+JOIN = 3
+STORE = 4
+
+# Run the explicit stack of tasks of an operation of 'bdd', starting
+# with 'task'. The (EXPAND,...) tasks are particular to the operation,
+# and 'expand(task,stack)' returns the result of one, or pushes the
+# tasks for its sub-calls to 'stack' and returns None. The other tasks
+# are the same for all operations:
+#   (BUILD,key,var,negate)          make a node from the two latest
+#                                   results, negated if 'negate' (ITE)
+#   (BRANCH,key,decisive,join,task) if the latest result is 'decisive'
+#                                   (a quantified variable whose positive
+#                                   cofactor decides the result), it is
+#                                   the result, and otherwise do 'task'
+#                                   for the negative cofactor and JOIN
+#   (JOIN,key,join)                 join(r1,r0) of the two latest results
+#   (STORE,key)                     the latest result, computed by
+#                                   another call, is also for this call
+# Each result is entered in the computed table with 'key', before any
+# negation. The results of the tasks are pushed to 'results'.
+
+def runTasks(bdd,task,expand):
+    results = []
+    stack = [task]
+    while stack:
+        task = stack.pop()
+        kind = task[0]
+
+        if kind == EXPAND:
+            result = expand(task,stack)
+            if result is not None:
+                results.append(result)
+
+        elif kind == BUILD:
+            _,key,rootVar,negate = task
+            child2 = results.pop()
+            child1 = results.pop()
+            result = bdd.newOBDDnode(rootVar,child1,child2)
+            bdd.cache.insert(key,result)
+            results.append(flip(result) if negate else result)
+
+        elif kind == BRANCH:
+            _,key,decisive,join,task0 = task
+            if results[-1] == decisive:
+                bdd.cache.insert(key,decisive)
+            else:
+                stack.append((JOIN,key,join))
+                stack.append(task0)
+
+        elif kind == JOIN:
+            _,key,join = task
+            r0 = results.pop()
+            r1 = results.pop()
+            result = join(r1,r0)
+            bdd.cache.insert(key,result)
+            results.append(result)
+
+        else:
+            bdd.cache.insert(task[1],results[-1])
+
+    return results.pop()
+
+# Safe points for garbage collection and reordering
+#
+# Garbage collection cannot be done in the middle of an operation,
+# because the partial results of the operation are not yet reachable
+# from any root. The public operations of OBDD are wrapped with
+# 'safepoint', which collects garbage (if the trigger in gcNeeded says
+# so) only when the outermost operation returns, keeping its result.
+# The same holds for the automatic variable reordering.
+#
+# The wrapper also counts and times the calls of the operations, but
+# only if profiling or tracing is on (see OBDD.stats and OBDD.trace),
+# so that this costs nothing otherwise.
+
+def safepoint(op):
+    name = op.__name__
+    def wrapped(self,*args,**kwargs):
+        profiling = self.profiling or self.traceFile is not None
+        if profiling:
+            start = time.perf_counter()
+        self.opDepth = self.opDepth + 1
+        try:
+            result = op(self,*args,**kwargs)
+        finally:
+            self.opDepth = self.opDepth - 1
+        if profiling:
+            self.recordCall(name,time.perf_counter() - start)
+        if self.opDepth == 0:
+            self.safePoint(result)
+        return result
+    return wrapped
 
 # Class for an OBDD with a given variable ordering, and with
 # each subgraph induced by a node representing a Boolean function.
 
 class OBDD():
 
+    # With arrays=True the constructor returns an ArrayOBDD instead,
+    # which has the same interface but stores the nodes in arrays.
+    # ArrayOBDD supports only 'cacheSize', 'cachePolicy' and 'lazyCount':
+    # complemented edges, garbage collection, reordering and profiling
+    # are not available with arrays=True, and asking for them raises
+    # a ValueError.
+
+    def __new__(cls,vars,*args,arrays=False,**kwargs):
+        if arrays:
+            return ArrayOBDD(vars,*args,**kwargs)
+        return super().__new__(cls)
+
     # Initialize an OBDD with a given variable ordering.
 
-    def __init__(self,vars):
+    def __init__(self,vars,cacheSize=2**18,cachePolicy='lru',lazyCount=False,arrays=False,complement=False,gcThreshold=None,gcGrowth=2.0,reorderThreshold=None,profile=False):
 
         # 'vars' is a list of variable names (strings), indicating
         # the variable ordering of the OBDD.
-
-        self.vars = vars
+        # 'cacheSize' and 'cachePolicy' configure the computed table
+        # of the APPLY operation (see ComputedTable above.)
+        # 'lazyCount' postpones model-counting until countModels is
+        # called, instead of counting every node when it is created.
+        # 'complement' turns on complemented edges (see OBDDcomplement.)
+        # 'gcThreshold' turns on automatic garbage collection, when the
+        # unique table has at least that many nodes, and 'gcGrowth' sets
+        # how much the live nodes can grow before the next collection.
+        # With automatic collection, every OBDD that is used after later
+        # operations must be protected with 'ref' (see collectGarbage.)
+        # 'reorderThreshold' turns on automatic variable reordering by
+        # sifting, when the unique table has at least that many nodes.
+        # It requires 'ref' in the same way as garbage collection.
+        # 'profile' turns on counting and timing the calls of the
+        # operations (see stats.)
+
+        self.vars = list(vars)
 
         # 'hash' is a dictionary for mapping var, child1, child2 to
         # the unique OBDD node with these properties.
@@ -79,6 +370,387 @@ class OBDD():
         for i in range(0,len(vars)):
             self.varIndex[vars[i]] = i
 
+        # 'cache' is the computed table for the APPLY operation.
+
+        self.cache = ComputedTable(cacheSize,cachePolicy)
+
+        # 'lazyCount' is True if model-counts are computed on demand only.
+
+        self.lazyCount = lazyCount
+
+        # 'complement' is True if negation is by complemented edges.
+
+        self.complement = complement
+
+        # Garbage collection: 'refs' maps the externally referenced
+        # nodes to their reference counts, 'gcLimit' is the node count
+        # that triggers the next collection (None if never), and
+        # 'opDepth' is the number of public operations in progress.
+
+        self.refs = dict()
+        self.gcThreshold = gcThreshold
+        self.gcGrowth = gcGrowth
+        self.gcLimit = gcThreshold
+        self.opDepth = 0
+        self.gcCount = 0
+        self.gcCollected = 0
+        self.gcTime = 0.0
+
+        # Reordering: 'reorderLimit' is the node count that triggers
+        # the next automatic reordering (None if never.)
+
+        self.reorderThreshold = reorderThreshold
+        self.reorderLimit = reorderThreshold
+        self.reorderCount = 0
+        self.reorderTime = 0.0
+
+        # Statistics: the largest number of nodes seen at a safe point,
+        # and when profiling, the number of calls and the time spent
+        # for each operation. 'traceFile' is the file where every call
+        # is recorded (see trace), or None.
+
+        self.peakNodes = 0
+        self.profiling = profile
+        self.opCalls = dict()
+        self.opTime = dict()
+        self.traceFile = None
+
+    # Empty the computed table. This must be done whenever nodes are
+    # removed from 'hash', as the cache may refer to them.
+
+    def clearCache(self):
+        self.cache.clear()
+
+    # Hit/miss statistics of the computed table
+
+    def cacheStats(self):
+        return self.cache.stats()
+
+    # External references to OBDDs. A referenced OBDD and all of its
+    # nodes survive garbage collection. 'ref' and 'deref' must be
+    # called in pairs, and they return their argument for convenience.
+
+    def ref(self,b):
+        if not isinstance(b,int):
+            r = regular(b)
+            self.refs[r] = self.refs.get(r,0) + 1
+        return b
+
+    def deref(self,b):
+        if not isinstance(b,int):
+            r = regular(b)
+            if self.refs[r] == 1:
+                del self.refs[r]
+            else:
+                self.refs[r] = self.refs[r] - 1
+        return b
+
+    # Should garbage be collected now?
+
+    def gcNeeded(self):
+        return self.gcLimit is not None and len(self.hash) >= self.gcLimit
+
+    # Mark-and-sweep garbage collection. Nodes reachable from the
+    # referenced OBDDs or from 'roots' are marked live, and all other
+    # nodes are removed from the unique table. As the computed table
+    # may refer to the removed nodes, it is cleared.
+    # Returns the number of removed nodes.
+
+    def collectGarbage(self,roots=[]):
+        start = time.perf_counter()
+        if len(self.hash) > self.peakNodes:
+            self.peakNodes = len(self.hash)
+
+        # Mark
+
+        live = set()
+        stack = [ regular(b) for b in roots if not isinstance(b,int) ] + list(self.refs)
+        while stack:
+            b = stack.pop()
+            if b in live:
+                continue
+            live.add(b)
+            for c in (b.posChild,b.negChild):
+                if not isinstance(c,int):
+                    stack.append(regular(c))
+
+        # Sweep
+
+        dead = len(self.hash) - len(live)
+        self.hash = { k : b for k,b in self.hash.items() if b in live }
+        self.clearCache()
+
+        # Next collection when the live nodes have grown enough
+
+        if self.gcThreshold is not None:
+            self.gcLimit = max(self.gcThreshold,int(self.gcGrowth * len(self.hash)))
+        self.gcCount = self.gcCount + 1
+        self.gcCollected = self.gcCollected + dead
+        self.gcTime = self.gcTime + time.perf_counter() - start
+        return dead
+
+    # Statistics of garbage collection
+
+    def gcStats(self):
+        return { "live" : len(self.hash),
+                 "referenced" : len(self.refs),
+                 "collections" : self.gcCount,
+                 "collected" : self.gcCollected,
+                 "time" : self.gcTime,
+                 "limit" : self.gcLimit }
+
+    # Dynamic variable reordering
+    #
+    # The variable ordering is changed by swapping adjacent levels in
+    # place. When variable x at level i and y at level i+1 are swapped:
+    #   - the y-nodes move to level i as they are
+    #   - the x-nodes with no y-node as a child move to level i+1 as they are
+    #   - every other x-node (x,(y,f11,f10),(y,f01,f00)) is changed in place
+    #     to (y,(x,f11,f01),(x,f10,f00)), with new x-nodes as needed
+    # Every node still represents the same Boolean function, so all OBDDs
+    # held by the user remain valid. The y-nodes that are no longer used
+    # are removed immediately, which is why every node has a reference
+    # count 'rc' (its parents plus external references) during reordering.
+    #
+    # Should the variables be reordered now?
+
+    def reorderNeeded(self):
+        return self.reorderLimit is not None and len(self.hash) >= self.reorderLimit
+
+    # Reorder the variables by sifting [Rudell 1993]. Each variable,
+    # starting from those with the most nodes, is moved through all
+    # levels and left where the OBDD is the smallest. A direction is
+    # abandoned when the OBDD grows more than 'maxGrowth' times the best
+    # size so far. Like garbage collection, this keeps only the nodes
+    # reachable from referenced OBDDs and from 'roots'.
+    # Returns the new variable ordering.
+
+    def reorder(self,roots=[],maxGrowth=1.2):
+        self.collectGarbage(roots)
+        start = time.perf_counter()
+
+        # Reference counts, and the nodes on every level
+
+        self.rc = { b : 0 for b in self.hash.values() }
+        self.levelNodes = [ set() for v in self.vars ]
+        for b in self.hash.values():
+            self.levelNodes[self.level(b)].add(b)
+            self.incRef(b.posChild)
+            self.incRef(b.negChild)
+        for b,n in self.refs.items():
+            self.rc[b] = self.rc[b] + n
+        for b in roots:
+            self.incRef(b)
+
+        # Sift every variable
+
+        for v in sorted(self.vars,key=(lambda v : -len(self.levelNodes[self.varIndex[v]]))):
+            self.siftVariable(v,maxGrowth)
+
+        del self.rc
+        del self.levelNodes
+        self.clearCache()
+
+        if self.reorderThreshold is not None:
+            self.reorderLimit = max(self.reorderThreshold,2 * len(self.hash))
+        self.reorderCount = self.reorderCount + 1
+        self.reorderTime = self.reorderTime + time.perf_counter() - start
+        return list(self.vars)
+
+    # Move variable v down to the last level, up to the first level,
+    # and finally to the level where the OBDD was the smallest.
+
+    def siftVariable(self,v,maxGrowth):
+        i = self.varIndex[v]
+        best = len(self.hash)
+        bestLevel = i
+        while i < len(self.vars)-1:
+            self.swapLevels(i)
+            i = i + 1
+            if len(self.hash) < best:
+                best,bestLevel = len(self.hash),i
+            if len(self.hash) > maxGrowth * best:
+                break
+        while i > 0:
+            self.swapLevels(i-1)
+            i = i - 1
+            if len(self.hash) < best:
+                best,bestLevel = len(self.hash),i
+            if len(self.hash) > maxGrowth * best:
+                break
+        while i < bestLevel:
+            self.swapLevels(i)
+            i = i + 1
+        while i > bestLevel:
+            self.swapLevels(i-1)
+            i = i - 1
+
+    # Swap the variables at levels i and i+1 (see above.)
+
+    def swapLevels(self,i):
+        x = self.vars[i]
+        y = self.vars[i+1]
+        self.vars[i],self.vars[i+1] = y,x
+        self.varIndex[x],self.varIndex[y] = i+1,i
+
+        xnodes = self.levelNodes[i]
+        ynodes = self.levelNodes[i+1]
+        self.levelNodes[i] = ynodes
+        self.levelNodes[i+1] = set()
+
+        # Model-counts of the nodes that do not depend on the variable
+        # that moved past them change by one level.
+
+        for b in ynodes:
+            if b.modelCount is not None:
+                b.modelCount = b.modelCount << 1
+
+        def isY(b):
+            return not isinstance(b,int) and b.nodeVar == y
+
+        changed = []
+        for b in xnodes:
+            if isY(b.posChild) or isY(b.negChild):
+                changed.append(b)
+            else:
+                if b.modelCount is not None:
+                    b.modelCount = b.modelCount >> 1
+                self.levelNodes[i+1].add(b)
+
+        def cofactors(b):
+            if isY(b):
+                return (b.posChild,b.negChild)
+            return (b,b)
+
+        for b in changed:
+            f1,f0 = b.posChild,b.negChild
+            f11,f10 = cofactors(f1)
+            f01,f00 = cofactors(f0)
+            del self.hash[(x,f1,f0)]
+            c1 = self.reorderNode(x,f11,f01)
+            c0 = self.reorderNode(x,f10,f00)
+            b.nodeVar,b.posChild,b.negChild = y,c1,c0
+            self.hash[(y,c1,c0)] = b
+            ynodes.add(b)
+            self.incRef(c1)
+            self.incRef(c0)
+            self.decRef(f1)
+            self.decRef(f0)
+
+    # Find or create a node during reordering, keeping track of the
+    # reference counts and the nodes on each level.
+
+    def reorderNode(self,v,child1,child2):
+        b = self.newOBDDnode(v,child1,child2)
+        r = regular(b)
+        if not isinstance(r,int) and r not in self.rc:
+            self.rc[r] = 0
+            self.levelNodes[self.level(r)].add(r)
+            self.incRef(r.posChild)
+            self.incRef(r.negChild)
+        return b
+
+    def incRef(self,b):
+        if not isinstance(b,int):
+            b = regular(b)
+            self.rc[b] = self.rc[b] + 1
+
+    # Decrement the reference count, and remove the nodes that are no
+    # longer referenced.
+
+    def decRef(self,b):
+        stack = [b]
+        while stack:
+            b = stack.pop()
+            if isinstance(b,int):
+                continue
+            b = regular(b)
+            self.rc[b] = self.rc[b] - 1
+            if self.rc[b] == 0:
+                del self.rc[b]
+                del self.hash[(b.nodeVar,b.posChild,b.negChild)]
+                self.levelNodes[self.level(b)].discard(b)
+                stack.append(b.posChild)
+                stack.append(b.negChild)
+
+    # Statistics of reordering
+
+    def reorderStats(self):
+        return { "order" : list(self.vars),
+                 "nodes" : len(self.hash),
+                 "reorderings" : self.reorderCount,
+                 "time" : self.reorderTime,
+                 "limit" : self.reorderLimit }
+
+    # Things to do when the outermost operation returns 'result', which
+    # is one OBDD or a list of OBDDs (as from load)
+
+    def safePoint(self,result):
+        roots = result if isinstance(result,list) else [result]
+        if len(self.hash) > self.peakNodes:
+            self.peakNodes = len(self.hash)
+        if self.gcNeeded():
+            self.collectGarbage(roots)
+        if self.reorderNeeded():
+            self.reorder(roots)
+
+    # Instrumentation
+    #
+    # Record one call of an operation: its name, its duration, how deep
+    # it was nested in other operations, and the size of the unique table.
+
+    def recordCall(self,name,duration):
+        if self.profiling:
+            self.opCalls[name] = self.opCalls.get(name,0) + 1
+            self.opTime[name] = self.opTime.get(name,0.0) + duration
+        if self.traceFile is not None:
+            self.traceFile.write(name + "\t" + str(self.opDepth) + "\t" + ("%.6f" % duration) + "\t" + str(len(self.hash)) + "\n")
+
+    # Record every call of an operation in the file 'filename', one line
+    # per call, while in the 'with' statement:
+    #   with bdd.trace("trace.txt"):
+    #       ...
+    # The lines have the operation, nesting depth (0 for the outermost
+    # operation), duration in seconds and the number of nodes, separated
+    # by tabs. Nested operations are recorded before the enclosing one.
+
+    @contextmanager
+    def trace(self,filename):
+        previous = self.traceFile
+        with open(filename,'w') as f:
+            f.write("operation\tdepth\tseconds\tnodes\n")
+            self.traceFile = f
+            try:
+                yield f
+            finally:
+                self.traceFile = previous
+
+    # Number of nodes on every level, as a list of (variable,count) pairs
+    # in the variable ordering
+
+    def levelSizes(self):
+        counts = [0] * len(self.vars)
+        for b in self.hash.values():
+            counts[self.level(b)] = counts[self.level(b)] + 1
+        return list(zip(self.vars,counts))
+
+    # All statistics of the OBDD. The unique table is a Python dictionary
+    # that manages its own capacity, so there is no load factor for it.
+    # The number of calls of each operation ('calls') and the time spent
+    # in them ('time', including nested operations) are only available
+    # with profiling on.
+
+    def stats(self):
+        return { "nodes" : len(self.hash),
+                 "peakNodes" : max(self.peakNodes,len(self.hash)),
+                 "variables" : len(self.vars),
+                 "levels" : self.levelSizes(),
+                 "cache" : self.cacheStats(),
+                 "gc" : self.gcStats(),
+                 "reorder" : self.reorderStats(),
+                 "calls" : dict(self.opCalls),
+                 "time" : dict(self.opTime) }
+
     # Create a new node if one does not already exist.
     # Must check that child1 and child2 are different:
     # if they are the same, return the child directly,
@@ -88,82 +760,318 @@ class OBDD():
     def newOBDDnode(self,rootVar,child1,child2):
         if child1 == child2:
             return child1
+
+        # With complemented edges, a node with a complemented positive
+        # child is represented as the complement of its negation.
+
+        if self.complement and (child1 == 0 or isinstance(child1,OBDDcomplement)):
+            return flip(self.newOBDDnode(rootVar,flip(child1),flip(child2)))
+
         if (rootVar,child1,child2) in self.hash:
             return self.hash[(rootVar,child1,child2)]
         newNode = OBDDnode(rootVar,child1,child2)
         self.hash[(rootVar,child1,child2)] = newNode
 
-        # Do model-count
+        # Store model-count, computed from the counts already stored
+        # in the child nodes. In the lazy mode this is postponed until
+        # the count is needed by countModels.
 
-        def modelcount(node):
-            if node == 1:
-                return 1
-            elif node == 0:
-                return 0
+        if self.lazyCount:
+            newNode.modelCount = None
+        else:
+            newNode.modelCount = self.nodeModelCount(newNode)
 
-            if type(node.posChild) == int:
-                i1 = len(self.vars)
-            else:
-                i1 = self.varIndex[node.posChild.nodeVar]
+        return newNode
 
-            if type(node.negChild) == int:
-                i0 = len(self.vars)
-            else:
-                i0 = self.varIndex[node.negChild.nodeVar]
+    # Level of a node in the variable ordering. The terminal nodes
+    # are below all variables.
+
+    def level(self,b):
+        if isinstance(b,int):
+            return len(self.vars)
+        return self.varIndex[b.nodeVar]
+
+    # Number of models of a node over the variables from its own
+    # level to the end of the ordering. Terminal nodes have 0 or 1
+    # models over the empty set of variables. A complemented node has
+    # all the assignments that are not models of the original node.
+
+    def storedCount(self,b):
+        if isinstance(b,int):
+            return b
+        if isinstance(b,OBDDcomplement):
+            return (1 << (len(self.vars)-self.level(b))) - b.regular.modelCount
+        return b.modelCount
+
+    # Model-count of a node from the stored counts of its children.
+    # Every variable skipped between the node and a child doubles the
+    # number of models of that child. This takes constant time.
+
+    def nodeModelCount(self,node):
+        i = self.level(node)
+        i1 = self.level(node.posChild)
+        i0 = self.level(node.negChild)
+        return (self.storedCount(node.posChild) << (i1-i-1)) + (self.storedCount(node.negChild) << (i0-i-1))
+
+    # Compute the missing model-counts in the lazy mode, for all
+    # nodes in the sub-DAG that do not yet have one. A node stays on
+    # the stack until the counts of both of its children are known.
+
+    def modelcount(self,b):
+        stack = [regular(b)]
+        while stack:
+            node = stack[-1]
+            if isinstance(node,int) or node.modelCount is not None:
+                stack.pop()
+                continue
+            c1 = node.posChild
+            c0 = regular(node.negChild)
+            ready = True
+            if not isinstance(c1,int) and c1.modelCount is None:
+                stack.append(c1)
+                ready = False
+            if not isinstance(c0,int) and c0.modelCount is None:
+                stack.append(c0)
+                ready = False
+            if ready:
+                node.modelCount = self.nodeModelCount(node)
+                stack.pop()
+        return self.storedCount(b)
+
+    # The APPLY operation for two OBDD nodes.
+    # 'f' is the Boolean function to be applied at
+    # leaf nodes. The connectives below use ITE instead,
+    # but APPLY works for any truth-table 'f'.
 
-            i = self.varIndex[node.nodeVar]
-       
-            count = pow(2, (i1-i-1)) * modelcount(node.posChild) + pow(2,(i0-i-1)) * modelcount(node.negChild)
+    def apply(self,f,b1,b2):
 
-            return count
+        # The recursion is done with an explicit stack of tasks (see
+        # runTasks), with (EXPAND,b1,b2) for computing the result for
+        # b1 and b2.
 
-            
-        # Store model-count
+        def expand(task,stack):
+            _,b1,b2 = task
+            if isinstance(b1,int) and isinstance(b2,int):
+                return f(b1,b2)
 
-        newNode.modelCount = modelcount(newNode)
+            # Has the same operation already been done for these nodes?
 
-        return newNode
+            key = (f,b1,b2)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
 
-    # The APPLY operation for two OBDD nodes.
-    # 'f' is the Boolean function to be applied at
-    # leaf nodes.
+            l1 = self.level(b1)
+            l2 = self.level(b2)
+            i = min(l1,l2)
+            rootVar = self.vars[i]
+            f1,f0 = (b1.posChild,b1.negChild) if l1 == i else (b1,b1)
+            g1,g0 = (b2.posChild,b2.negChild) if l2 == i else (b2,b2)
+            stack.append((BUILD,key,rootVar,False))
+            stack.append((EXPAND,f0,g0))
+            stack.append((EXPAND,f1,g1))
 
-    def apply(self,f,b1,b2):
+        return runTasks(self,(EXPAND,b1,b2),expand)
+
+    # The If-Then-Else operation ITE(f,g,h) = (f AND g) OR (NOT f AND h),
+    # with which every binary connective can be expressed.
+    #
+    # Triples that obviously have the same result are first normalized to
+    # one standard triple, so that they share one computed table entry:
+    #   - an argument g or h that is f (or NOT f) is replaced by a constant
+    #   - for the commutative forms ITE(f,1,h) = ITE(h,1,f) and so on,
+    #     the argument with the smallest top variable is put first
+    #   - with complemented edges, f and g are made uncomplemented by
+    #     ITE(NOT f,g,h) = ITE(f,h,g) and ITE(f,NOT g,h) = NOT ITE(f,g,NOT h)
+    # Terminal cases, like ITE(f,g,0) with g = 0, end the recursion
+    # without looking at the rest of the arguments.
+
+    def ite(self,f,g,h):
+
+        # Explicit stack of tasks as in APPLY, with (EXPAND,f,g,h) for
+        # computing ITE(f,g,h)
+
+        def expand(task,stack):
+            _,f,g,h = task
+            terminal,f,g,h,negate = self.standardTriple(f,g,h)
+            if terminal is not None:
+                return terminal
+
+            # Has the same operation already been done?
+
+            key = ('ite',f,g,h)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return flip(result) if negate else result
+
+            # Split on the first variable in f, g and h. f is never a
+            # terminal node here.
+
+            lf = self.varIndex[f.nodeVar]
+            lg = self.level(g)
+            lh = self.level(h)
+            i = min(lf,lg,lh)
+            f1,f0 = (f.posChild,f.negChild) if lf == i else (f,f)
+            g1,g0 = (g.posChild,g.negChild) if lg == i else (g,g)
+            h1,h0 = (h.posChild,h.negChild) if lh == i else (h,h)
+            stack.append((BUILD,key,self.vars[i],negate))
+            stack.append((EXPAND,f0,g0,h0))
+            stack.append((EXPAND,f1,g1,h1))
+
+        return runTasks(self,(EXPAND,f,g,h),expand)
+
+    # Terminal cases and standard triples for ITE. Returns either the
+    # result of a terminal case and the triple unchanged, or None and
+    # the standard triple, with 'negate' telling if the result of the
+    # standard triple must be negated.
+
+    def standardTriple(self,f,g,h):
+
+        # Terminal cases
+
+        if f == 1:
+            return (g,f,g,h,False)
+        if f == 0:
+            return (h,f,g,h,False)
+        if self.isNegation(g,f):
+            g = 0
+        elif g is f:
+            g = 1
+        if self.isNegation(h,f):
+            h = 1
+        elif h is f:
+            h = 0
+        if g == h:
+            return (g,f,g,h,False)
+        if g == 1 and h == 0:
+            return (f,f,g,h,False)
+        if g == 0 and h == 1 and self.complement:
+            return (flip(f),f,g,h,False)
+
+        # Standard triples for the commutative cases
+
+        if g == 1:
+            if self.before(h,f):
+                f,h = h,f
+        elif h == 0:
+            if self.before(g,f):
+                f,g = g,f
+        elif self.complement:
+            if h == 1:
+                if self.before(g,f):
+                    f,g = flip(g),flip(f)
+            elif g == 0:
+                if self.before(h,f):
+                    f,h = flip(h),flip(f)
+            elif self.isNegation(h,g):
+                if self.before(g,f):
+                    f,g,h = g,f,flip(f)
+
+        # Standard triples for complemented edges
+
+        negate = False
+        if self.complement:
+            if isinstance(f,OBDDcomplement):
+                f,g,h = f.regular,h,g
+            if g == 0 or isinstance(g,OBDDcomplement):
+                g,h = flip(g),flip(h)
+                negate = True
+
+        return (None,f,g,h,negate)
+
+    # Is b1 the negation of b2? Only recognized with complemented edges.
+
+    def isNegation(self,b1,b2):
         if isinstance(b1,int) and isinstance(b2,int):
-            return f(b1,b2)
-        if isinstance(b1,int) and isinstance(b2,OBDDnode):
-            return self.newOBDDnode(b2.nodeVar,
-                                    self.apply(f,b1,b2.posChild),
-                                    self.apply(f,b1,b2.negChild))
-        elif isinstance(b1,OBDDnode) and isinstance(b2,int):
-            return self.newOBDDnode(b1.nodeVar,
-                                    self.apply(f,b1.posChild,b2),
-                                    self.apply(f,b1.negChild,b2))
-        else:
-            root1 = b1.nodeVar
-            root2 = b2.nodeVar
-
-            if root1==root2:
-                return self.newOBDDnode(root1,
-                                     self.apply(f,b1.posChild,b2.posChild),
-                                     self.apply(f,b1.negChild,b2.negChild))
-
-            if self.varIndex[root1] < self.varIndex[root2]:
-                rootVar = root1
-                child1 = self.apply(f,b1.posChild,b2)
-                child2 = self.apply(f,b1.negChild,b2)
-            else:
-                rootVar = root2
-                child1 = self.apply(f,b1,b2.posChild)
-                child2 = self.apply(f,b1,b2.negChild)
+            return b1 != b2
+        return self.complement and b1 is not b2 and regular(b1) is regular(b2)
+
+    # Fixed order of the nodes for the standard triples: by level,
+    # and for nodes on the same level by their identity.
+
+    def before(self,b1,b2):
+        return (self.level(b1),id(regular(b1))) < (self.level(b2),id(regular(b2)))
 
-            return self.newOBDDnode(rootVar,child1,child2)
+    # The two sub-OBDDs of b for the variable at level i, when b
+    # does not have variables before i.
+
+    def cofactors(self,b,i):
+        if self.level(b) == i:
+            return (b.posChild,b.negChild)
+        return (b,b)
 
     # Return the model-count of a BDD node, taking into account variables
     # before the root node in the variable ordering.
 
     def countModels(self,b):
-        return b.modelCount * round(math.pow(2, self.varIndex[b.nodeVar]))
+        return self.modelcount(b) << self.level(b)
+
+    # Enumerate the models of an OBDD as cubes, that is, as dictionaries
+    # that assign 0 or 1 to the variables on one path from the root to
+    # the terminal node 1. Variables not in a cube can have any value.
+    # The cubes are generated one at a time by a depth-first traversal.
+    # Only the current path is stored, in 'cube' and with its variables
+    # in order in 'path', and the stack has the pending branches, at most
+    # one for each node on the path, with the length of the path where
+    # they branch off. Going to a pending branch first undoes the
+    # assignments below that point, so memory is proportional to the
+    # depth of the OBDD. Each cube is yielded as a copy.
+
+    def cubes(self,b):
+        cube = {}
+        path = []
+        stack = [(b,0,None,None)]
+        while stack:
+            node,depth,v,value = stack.pop()
+            while len(path) > depth:
+                del cube[path.pop()]
+            if v is not None:
+                cube[v] = value
+                path.append(v)
+            if node == 0:
+                continue
+            if node == 1:
+                yield dict(cube)
+                continue
+            stack.append((node.negChild,len(path),node.nodeVar,0))
+            stack.append((node.posChild,len(path),node.nodeVar,1))
+
+    # Enumerate the models of an OBDD as full assignments to all of
+    # the variables of the OBDD, one at a time.
+
+    def models(self,b):
+        for cube in self.cubes(b):
+            free = [ v for v in self.vars if v not in cube ]
+            for values in itertools.product([0,1],repeat=len(free)):
+                model = dict(cube)
+                model.update(zip(free,values))
+                yield model
+
+    # Pick a model of an OBDD uniformly at random, or return None if
+    # there are no models. Going from the root towards the terminal
+    # node 1, the value of each variable is chosen with probability
+    # proportional to the number of models of the corresponding child,
+    # and the variables skipped by the path are chosen with probability
+    # 1/2. This takes time linear in the number of variables.
+
+    def sample(self,b,rng=random):
+        if b == 0:
+            return None
+        self.modelcount(b)
+        model = dict()
+        for i in range(0,len(self.vars)):
+            v = self.vars[i]
+            if self.level(b) > i:
+                model[v] = rng.randrange(2)
+                continue
+            c1,c0 = b.posChild,b.negChild
+            w1 = self.storedCount(c1) << (self.level(c1)-i-1)
+            w0 = self.storedCount(c0) << (self.level(c0)-i-1)
+            if rng.randrange(w1+w0) < w1:
+                model[v],b = 1,c1
+            else:
+                model[v],b = 0,c0
+        return model
 
     # Constructors for OBDDs
     #
@@ -174,30 +1082,542 @@ class OBDD():
 
     # Constructors for common Boolean functions:
         
+    @safepoint
     def conj(self,b1,b2):
-        return self.apply(AND,b1,b2)
+        return self.ite(b1,b2,0)
 
+    @safepoint
     def disj(self,b1,b2):
-        return self.apply(OR,b1,b2)
+        return self.ite(b1,1,b2)
 
+    @safepoint
     def neg(self,b):
-        return self.apply(XOR,b,1)
+        if self.complement:
+            return flip(b)
+        return self.ite(b,0,1)
 
+    @safepoint
     def impl(self,b1,b2):
-        return self.apply(IMPL,b1,b2)
+        return self.ite(b1,b2,1)
 
+    @safepoint
     def eqvi(self,b1,b2):
-        return self.apply(EQVI,b1,b2)
+        return self.ite(b1,b2,self.neg(b2))
 
     # Chain conjunction and disjunction
+    #
+    # The order in which the OBDDs are combined does not affect the
+    # result, but it can affect the sizes of the intermediate OBDDs a lot.
+    # The 'schedule' is one of
+    #   'linear'   : left to right, ((b1 op b2) op b3) op ...
+    #   'balanced' : as a balanced binary tree, combining neighbors pairwise
+    #   'smallest' : always the two smallest OBDDs (by node count) first
+    #   'cluster'  : always the two OBDDs with the most similar supports,
+    #                measured by shared variables per all variables
+    # With record=True, the sizes of the intermediate OBDDs are stored in
+    # 'intermediateSizes'. This is off by default, as it takes a traversal
+    # of every intermediate OBDD.
+
+    SCHEDULES = ('linear','balanced','smallest','cluster')
+
+    @safepoint
+    def conjs(self,bb,schedule='linear',record=False):
+        return self.combine(self.conj,bb,1,0,schedule,record)
+
+    @safepoint
+    def disjs(self,bb,schedule='linear',record=False):
+        return self.combine(self.disj,bb,0,1,schedule,record)
+
+    # Number of nodes in an OBDD, not counting the terminal nodes
+
+    def size(self,b):
+        visited = set()
+        stack = [b]
+        while stack:
+            b = regular(stack.pop())
+            if isinstance(b,int) or b in visited:
+                continue
+            visited.add(b)
+            stack.append(b.posChild)
+            stack.append(b.negChild)
+        return len(visited)
+
+    # Combine the OBDDs 'bb' with 'op', which has 'unit' as its unit
+    # element and 'zero' as its zero element (which ends the computation.)
+
+    def combine(self,op,bb,unit,zero,schedule,record):
+        if schedule not in self.SCHEDULES:
+            raise ValueError("Unknown schedule: " + str(schedule))
+        self.intermediateSizes = []
+
+        def apply(b1,b2):
+            b = op(b1,b2)
+            if record:
+                self.intermediateSizes.append(self.size(b))
+            return b
+
+        bb = list(bb)
+        if len(bb) == 0:
+            return unit
+        if zero in bb:
+            return zero
+
+        if schedule == 'linear':
+            result = bb[0]
+            for b in bb[1:]:
+                result = apply(result,b)
+                if result == zero:
+                    break
+            return result
+
+        if schedule == 'balanced':
+            while len(bb) > 1:
+                pairs = [ apply(bb[i],bb[i+1]) for i in range(0,len(bb)-1,2) ]
+                if len(bb) % 2 == 1:
+                    pairs.append(bb[-1])
+                bb = pairs
+                if zero in bb:
+                    return zero
+            return bb[0]
+
+        if schedule == 'smallest':
+            queue = [ (self.size(bb[i]),i,bb[i]) for i in range(0,len(bb)) ]
+            heapq.heapify(queue)
+            n = len(bb)
+            while len(queue) > 1:
+                s1,i1,b1 = heapq.heappop(queue)
+                s2,i2,b2 = heapq.heappop(queue)
+                b = apply(b1,b2)
+                if b == zero:
+                    return zero
+                heapq.heappush(queue,(self.size(b),n,b))
+                n = n + 1
+            return queue[0][2]
+
+        if schedule == 'cluster':
+            supports = [ self.support(b) for b in bb ]
+
+            def similarity(i,j):
+                union = len(supports[i] | supports[j])
+                if union == 0:
+                    return 1.0
+                return len(supports[i] & supports[j]) / union
+
+            while len(bb) > 1:
+                i,j = max([ (i,j) for i in range(0,len(bb)) for j in range(i+1,len(bb)) ],
+                          key=(lambda p : similarity(p[0],p[1])))
+                b = apply(bb[i],bb[j])
+                if b == zero:
+                    return zero
+                s = supports[i] | supports[j]
+                del bb[j],supports[j]
+                bb[i],supports[i] = b,s
+            return bb[0]
+
+    # Variables occurring in an OBDD
+
+    def support(self,b):
+        vs = set()
+        visited = set()
+        stack = [b]
+        while stack:
+            b = regular(stack.pop())
+            if isinstance(b,int) or b in visited:
+                continue
+            visited.add(b)
+            vs.add(b.nodeVar)
+            stack.append(b.posChild)
+            stack.append(b.negChild)
+        return vs
+
+    # Quantification, renaming and relational product
+    #
+    # The names and the order of the arguments are the same as in
+    # the 'dd' package, so that OBDD can be used in place of it.
+    #
+    # Existential and universal abstraction of the variables 'vars'
+
+    @safepoint
+    def exist(self,vars,b):
+        vs = frozenset(vars)
+        return self.quantify(b,vs,self.lastLevel(vs),True)
+
+    @safepoint
+    def forall(self,vars,b):
+        vs = frozenset(vars)
+        return self.quantify(b,vs,self.lastLevel(vs),False)
+
+    # The last level with a variable in 'vs'
+
+    def lastLevel(self,vs):
+        return max([ self.varIndex[v] for v in vs ],default=-1)
+
+    # Both cofactors for a quantified variable are combined with OR
+    # for exist and with AND for forall. Below the last quantified
+    # variable there is nothing to do.
 
-    def conjs(self,bb):
-        return reduce(self.conj,bb,1)
+    def quantify(self,b,vs,last,existential):
 
-    def disjs(self,bb):
-        return reduce(self.disj,bb,0)
+        # Explicit stack of tasks as in APPLY, with (EXPAND,b) for
+        # abstracting the variables from b. A quantified variable
+        # BRANCHes on the result for its positive cofactor, which
+        # decides the result if it is 1 (exist) or 0 (forall).
+
+        op = 'exist' if existential else 'forall'
+        if existential:
+            decisive,join = 1,(lambda r1,r0 : self.ite(r1,1,r0))
+        else:
+            decisive,join = 0,(lambda r1,r0 : self.ite(r1,r0,0))
+
+        def expand(task,stack):
+            _,b = task
+            if isinstance(b,int) or self.level(b) > last:
+                return b
+
+            key = (op,vs,b)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            if b.nodeVar in vs:
+                stack.append((BRANCH,key,decisive,join,(EXPAND,b.negChild)))
+            else:
+                stack.append((BUILD,key,b.nodeVar,False))
+                stack.append((EXPAND,b.negChild))
+            stack.append((EXPAND,b.posChild))
+
+        return runTasks(self,(EXPAND,b),expand)
+
+    # Relational product: exist vars (b1 AND b2), without constructing
+    # the conjunction. The variables are quantified as soon as the
+    # recursion reaches them, so the result of each quantified level
+    # is the disjunction of two already abstracted conjunctions.
+
+    @safepoint
+    def and_exists(self,b1,b2,vars):
+        vs = frozenset(vars)
+        return self.relprod(b1,b2,vs,self.lastLevel(vs))
+
+    def relprod(self,b1,b2,vs,last):
+
+        # Explicit stack of tasks as in quantify, with (EXPAND,b1,b2)
+
+        join = lambda r1,r0 : self.ite(r1,1,r0)
+
+        def expand(task,stack):
+            _,b1,b2 = task
+            if b1 == 0 or b2 == 0:
+                return 0
+            if b1 == 1 or b1 is b2:
+                return self.quantify(b2,vs,last,True)
+            if b2 == 1:
+                return self.quantify(b1,vs,last,True)
+            if self.isNegation(b1,b2):
+                return 0
+            if min(self.level(b1),self.level(b2)) > last:
+                return self.ite(b1,b2,0)
+
+            # Conjunction is commutative.
+
+            if self.before(b2,b1):
+                b1,b2 = b2,b1
+
+            key = ('and_exists',vs,b1,b2)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            i = min(self.level(b1),self.level(b2))
+            f1,f0 = self.cofactors(b1,i)
+            g1,g0 = self.cofactors(b2,i)
+            if self.vars[i] in vs:
+                stack.append((BRANCH,key,1,join,(EXPAND,f0,g0)))
+            else:
+                stack.append((BUILD,key,self.vars[i],False))
+                stack.append((EXPAND,f0,g0))
+            stack.append((EXPAND,f1,g1))
+
+        return runTasks(self,(EXPAND,b1,b2),expand)
+
+    # Rename the variables of an OBDD with 'mapping', a dictionary from
+    # variables to variables. If the renaming preserves the order of
+    # the variables in the OBDD, every node is simply relabeled.
+    # Otherwise every node (x,b1,b2) becomes ITE(y,b1',b2'), where y is
+    # the new name of x, which works for any renaming.
+
+    @safepoint
+    def rename(self,mapping,b):
+        key = frozenset(mapping.items())
+        levels = sorted([ self.varIndex[v] for v in self.support(b) ])
+        newlevels = [ self.varIndex[mapping.get(self.vars[i],self.vars[i])] for i in levels ]
+        ordered = all(newlevels[j] < newlevels[j+1] for j in range(0,len(newlevels)-1))
+        return self.renameRec(b,mapping,key,ordered)
+
+    def renameRec(self,b,mapping,mkey,ordered):
+
+        # Explicit stack of tasks as in APPLY, with (EXPAND,b). The node
+        # for the new name of the variable is built directly if the order
+        # is preserved, and otherwise JOINed with ITE.
+
+        def expand(task,stack):
+            _,b = task
+            if isinstance(b,int):
+                return b
+
+            key = ('rename',mkey,b)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            v = mapping.get(b.nodeVar,b.nodeVar)
+            if ordered:
+                stack.append((BUILD,key,v,False))
+            else:
+                stack.append((JOIN,key,lambda r1,r0 : self.ite(self.newOBDDnode(v,1,0),r1,r0)))
+            stack.append((EXPAND,b.negChild))
+            stack.append((EXPAND,b.posChild))
+
+        return runTasks(self,(EXPAND,b),expand)
+
+    # Cofactors and simplification with respect to a care set
+    #
+    # restrict(f,a), with 'a' a dictionary from variables to 0 and 1,
+    # is the cofactor of f for the partial assignment a: f with every
+    # variable in a replaced by its value.
+    #
+    # restrict(f,c), with 'c' an OBDD, is the restrict operation of
+    # [Coudert and Madre 1990]: a function that agrees with f on all
+    # assignments in the care set c, and is usually smaller than f,
+    # as the branches outside c are replaced by their siblings.
+    #
+    # constrain(f,c) is the generalized cofactor of f with respect to c.
+    # It agrees with f on c, too, and it also distributes over the
+    # connectives, so (f AND g)|c = f|c AND g|c, and EXIST x (f|c AND c)
+    # is the same as EXIST x (f AND c), making it useful in image
+    # computation. It may however have more nodes than f.
+    #
+    # For the empty care set c = 0 both operations return 0.
+
+    @safepoint
+    def restrict(self,f,c):
+        if isinstance(c,dict):
+            assignment = frozenset(c.items())
+            last = self.lastLevel(set(c))
+            return self.cofactor(f,c,assignment,last)
+        return self.restrictRec(f,c)
+
+    @safepoint
+    def constrain(self,f,c):
+        return self.constrainRec(f,c)
+
+    # The cofactor, constrain and restrict operations use an explicit
+    # stack of tasks as in APPLY, with (STORE,key) when the result is
+    # that of another call, such as for a single cofactor of f.
+
+    def cofactor(self,b,c,assignment,last):
+
+        def expand(task,stack):
+            _,b = task
+            if isinstance(b,int) or self.level(b) > last:
+                return b
+
+            key = ('cofactor',assignment,b)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            if b.nodeVar in c:
+                stack.append((STORE,key))
+                stack.append((EXPAND,b.posChild if c[b.nodeVar] else b.negChild))
+            else:
+                stack.append((BUILD,key,b.nodeVar,False))
+                stack.append((EXPAND,b.negChild))
+                stack.append((EXPAND,b.posChild))
+
+        return runTasks(self,(EXPAND,b),expand)
+
+    def constrainRec(self,f,c):
+
+        def expand(task,stack):
+            _,f,c = task
+            if c == 0:
+                return 0
+            if c == 1 or isinstance(f,int):
+                return f
+            if f is c:
+                return 1
+            if self.isNegation(f,c):
+                return 0
+
+            key = ('constrain',f,c)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            i = min(self.level(f),self.level(c))
+            f1,f0 = self.cofactors(f,i)
+            c1,c0 = self.cofactors(c,i)
+            if c1 == 0:
+                stack.append((STORE,key))
+                stack.append((EXPAND,f0,c0))
+            elif c0 == 0:
+                stack.append((STORE,key))
+                stack.append((EXPAND,f1,c1))
+            else:
+                stack.append((BUILD,key,self.vars[i],False))
+                stack.append((EXPAND,f0,c0))
+                stack.append((EXPAND,f1,c1))
+
+        return runTasks(self,(EXPAND,f,c),expand)
+
+    def restrictRec(self,f,c):
+
+        def expand(task,stack):
+            _,f,c = task
+            if c == 0:
+                return 0
+            if c == 1 or isinstance(f,int):
+                return f
+            if f is c:
+                return 1
+            if self.isNegation(f,c):
+                return 0
+
+            key = ('restrict',f,c)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            # A variable of c that is not in f is quantified away from c.
+
+            if self.level(c) < self.level(f):
+                stack.append((STORE,key))
+                stack.append((EXPAND,f,self.ite(c.posChild,1,c.negChild)))
+                return
+            c1,c0 = self.cofactors(c,self.level(f))
+            if c1 == 0:
+                stack.append((STORE,key))
+                stack.append((EXPAND,f.negChild,c0))
+            elif c0 == 0:
+                stack.append((STORE,key))
+                stack.append((EXPAND,f.posChild,c1))
+            else:
+                stack.append((BUILD,key,f.nodeVar,False))
+                stack.append((EXPAND,f.negChild,c0))
+                stack.append((EXPAND,f.posChild,c1))
+
+        return runTasks(self,(EXPAND,f,c),expand)
+
+    # Save OBDDs to a binary file (see OBDDfile for the format.)
+    # 'roots' is one OBDD or a list of them.
+
+    def save(self,filename,roots):
+        if not isinstance(roots,list):
+            roots = [roots]
+
+        # Number the nodes so that children come before their parents.
+        # The terminal nodes 0 and 1 have numbers 0 and 1.
+
+        number = dict()
+        nodes = []
+        stack = [ regular(b) for b in roots ]
+        while stack:
+            b = stack[-1]
+            if isinstance(b,int) or b in number:
+                stack.pop()
+                continue
+            c1 = b.posChild
+            c0 = regular(b.negChild)
+            ready = True
+            for c in (c0,c1):
+                if not isinstance(c,int) and c not in number:
+                    stack.append(c)
+                    ready = False
+            if ready:
+                number[b] = len(nodes) + 2
+                nodes.append(b)
+                stack.pop()
+
+        def edge(b):
+            if isinstance(b,int):
+                return b << 1
+            if isinstance(b,OBDDcomplement):
+                return (number[b.regular] << 1) | 1
+            return number[b] << 1
+
+        with open(filename,'wb') as f:
+            f.write(struct.pack(OBDDfile.HEADER,OBDDfile.MAGIC,OBDDfile.VERSION,len(self.vars),len(nodes),len(roots)))
+            for v in self.vars:
+                name = v.encode('utf-8')
+                f.write(struct.pack('<I',len(name)))
+                f.write(name)
+            for b in roots:
+                f.write(struct.pack('<I',edge(b)))
+            for b in nodes:
+                f.write(struct.pack(OBDDfile.NODE,self.varIndex[b.nodeVar],edge(b.posChild),edge(b.negChild)))
+
+    # Load the OBDDs from a binary file, given as a file name or an
+    # OBDDfile. Only the nodes reachable from the roots (or from the
+    # 'roots' given as positions in the file) are created. If the file
+    # has the variables in the same order as this OBDD, the nodes are
+    # created directly, and otherwise with ITE.
+    # Returns the list of the loaded OBDDs.
+
+    @safepoint
+    def load(self,source,roots=None):
+        if isinstance(source,OBDDfile):
+            file = source
+        else:
+            file = OBDDfile(source)
+        if roots is None:
+            roots = range(0,len(file.roots))
+        edges = [ file.roots[r] for r in roots ]
+
+        for v in file.vars:
+            if v not in self.varIndex:
+                raise ValueError("Variable " + v + " not in the OBDD")
+        levels = [ self.varIndex[v] for v in file.vars ]
+        ordered = all(levels[i] < levels[i+1] for i in range(0,len(levels)-1))
+
+        # Nodes reachable from the roots, children before parents
+
+        reachable = set()
+        stack = [ e >> 1 for e in edges ]
+        while stack:
+            n = stack.pop()
+            if n < 2 or n in reachable:
+                continue
+            reachable.add(n)
+            v,e1,e0 = file.node(n)
+            stack.append(e1 >> 1)
+            stack.append(e0 >> 1)
+
+        built = { 0 : 0, 1 : 1 }
+
+        def edge(e):
+            b = built[e >> 1]
+            if e & 1:
+                return self.neg(b)
+            return b
+
+        for n in sorted(reachable):
+            v,e1,e0 = file.node(n)
+            if ordered:
+                built[n] = self.newOBDDnode(file.vars[v],edge(e1),edge(e0))
+            else:
+                built[n] = self.ite(self.newOBDDnode(file.vars[v],1,0),edge(e1),edge(e0))
+
+        result = [ edge(e) for e in edges ]
+        if not isinstance(source,OBDDfile):
+            file.close()
+        return result
 
     # Visualize an OBDD as a graph
+    #
+    # Only the nodes in the unique table are drawn. A complemented edge
+    # (only negative edges can be complemented) is drawn to the original
+    # node with a circle as the arrowhead. If the root itself is
+    # complemented, it is pointed to by such an edge from a point.
 
     def show(self,bdd,filename):
         import pygraphviz as pgv
@@ -205,57 +1625,64 @@ class OBDD():
 
         visited = set()
 
-        def visitAll(bddnode):
+        # Name of the graph node for an OBDD node
+
+        def nodeName(bddnode):
+            if bddnode == 0:
+                return "F"
+            elif bddnode == 1:
+                return "T"
+            return str(id(bddnode))
+
+        # Visit all nodes reachable from the root, visualizing every
+        # node, and then draw the arcs between them.
+
+        nodes = []
+        stack = [regular(bdd)]
+        while stack:
+            bddnode = stack.pop()
 
             # Already visualized?
             if bddnode in visited:
-                return
+                continue
 
             # Mark as already visualized.
             visited.update({bddnode})
 
             if isinstance(bddnode,int):
                 # Visualize terminal nodes.
-                if bddnode == 0:
-                    G.add_node("F")
-                else:
-                    G.add_node("T")
-                # End recursive call.
-                return
+                G.add_node(nodeName(bddnode))
+                continue
 
             # Visualize node, with unique object ID as name, and
             # variable name as the node label.
-            G.add_node(str(id(bddnode)))
-            n = G.get_node(str(id(bddnode)))
+            G.add_node(nodeName(bddnode))
+            n = G.get_node(nodeName(bddnode))
             n.attr["label"] = bddnode.nodeVar
-            if bddnode.modelCount > 0:
+            if bddnode.modelCount is not None and bddnode.modelCount > 0:
                 n.attr["xlabel"] = str(bddnode.modelCount)
+            nodes.append(bddnode)
 
-            # Visualize child nodes recursively.
-            visitAll(bddnode.posChild)
-            visitAll(bddnode.negChild)
+            # Visualize child nodes.
+            stack.append(regular(bddnode.negChild))
+            stack.append(regular(bddnode.posChild))
+
+        for bddnode in nodes:
 
             # Draw arc to the positive child node.
 
-            if bddnode.posChild == 0:
-                G.add_edge(str(id(bddnode)),"F", color="green")
-            elif bddnode.posChild == 1:
-                G.add_edge(str(id(bddnode)),"T", color="green")
-            else:
-                G.add_edge(str(id(bddnode)),str(id(bddnode.posChild)), color="green")
+            G.add_edge(nodeName(bddnode),nodeName(bddnode.posChild), color="green")
 
             # Draw arcs to the negative child node.
-            
-            if bddnode.negChild == 0:
-                G.add_edge(str(id(bddnode)),"F", color="red",style = "dashed")
-            elif bddnode.negChild == 1:
-                G.add_edge(str(id(bddnode)),"T", color="red",style = "dashed")
+
+            if isinstance(bddnode.negChild,OBDDcomplement):
+                G.add_edge(nodeName(bddnode),nodeName(bddnode.negChild.regular), color="red",style = "dashed",arrowhead="odot")
             else:
-                G.add_edge(str(id(bddnode)),str(id(bddnode.negChild)), color="red",style = "dashed")
+                G.add_edge(nodeName(bddnode),nodeName(bddnode.negChild), color="red",style = "dashed")
 
-        # Visualize all nodes by calling the root.
-        
-        visitAll(bdd)
+        if isinstance(bdd,OBDDcomplement):
+            G.add_node("root",shape="point")
+            G.add_edge("root",nodeName(bdd.regular),arrowhead="odot")
 
         # Use Dot for layout (better for directed graphs!)
 
@@ -265,6 +1692,370 @@ class OBDD():
 
         G.draw(filename)
 
+    # Write OBDDs in the DOT format to 'out', a file or a file name,
+    # without pygraphviz or a layout step. 'roots' is one OBDD or a list.
+    #
+    # The nodes are written in one breadth-first pass, each with its
+    # arcs as soon as it is reached. The nodes are named n1, n2, ... in
+    # the order they are reached, so the names are the same every time.
+    # Arcs are drawn as in 'show'. With 'maxNodes', at most that many
+    # nodes are written, and arcs to the nodes left out go to a node
+    # labeled '...'. With 'levels', the nodes of every level are put
+    # into a cluster of their own, written at the end.
+    # Returns the number of nodes written.
+
+    def writeDot(self,roots,out,maxNodes=None,levels=False):
+        if isinstance(out,str):
+            with open(out,'w') as f:
+                return self.writeDot(roots,f,maxNodes,levels)
+        if not isinstance(roots,list):
+            roots = [roots]
+
+        names = dict()
+        levelNames = dict()
+        queue = deque()
+        truncated = False
+
+        # Name of a node, given when it is reached for the first time.
+
+        def name(b):
+            nonlocal truncated
+            if isinstance(b,int):
+                return "T" if b == 1 else "F"
+            if b not in names:
+                if maxNodes is not None and len(names) >= maxNodes:
+                    truncated = True
+                    return "more"
+                names[b] = "n" + str(len(names)+1)
+                queue.append(b)
+            return names[b]
+
+        def arc(source,b,attrs):
+            if isinstance(b,OBDDcomplement):
+                out.write(source + " -> " + name(b.regular) + " [" + attrs + ",arrowhead=odot];\n")
+            else:
+                out.write(source + " -> " + name(b) + " [" + attrs + "];\n")
+
+        out.write("digraph OBDD {\n")
+        out.write("F [shape=box];\nT [shape=box];\n")
+        for i in range(0,len(roots)):
+            out.write("r" + str(i) + " [shape=point];\n")
+            arc("r" + str(i),roots[i],"style=bold")
+
+        while queue:
+            b = queue.popleft()
+            out.write(names[b] + " [label=\"" + str(b.nodeVar) + "\"];\n")
+            if levels:
+                levelNames.setdefault(self.level(b),[]).append(names[b])
+            arc(names[b],b.posChild,"color=green")
+            arc(names[b],b.negChild,"color=red,style=dashed")
+
+        if truncated:
+            out.write("more [label=\"...\",shape=plaintext];\n")
+        for i in sorted(levelNames):
+            out.write("subgraph cluster_" + str(i) + " {\nlabel=\"" + str(self.vars[i]) + "\";\n")
+            out.write(";\n".join(levelNames[i]) + ";\n}\n")
+        out.write("}\n")
+        return len(names)
+
+# Binary file of OBDDs, read through a memory map.
+#
+# The format is (all integers are 32-bit unsigned little-endian):
+#   header   : "OBDD", version, number of variables, nodes and roots
+#   variables: for each variable, the length of its UTF-8 name and the name
+#   roots    : one edge for each root
+#   nodes    : for nodes 2, 3, ..., the level of the variable of the
+#              node and the edges to its positive and negative child
+# An edge is 2 times the number of the node it points to, plus 1 if the
+# edge is complemented. The terminal nodes 0 and 1 have numbers 0 and 1,
+# and the children of a node always have smaller numbers than the node.
+#
+# The node records have a fixed size, so the nodes are read from the
+# memory map only when they are needed, and no Python objects are
+# created for them. An OBDDfile can be evaluated as is, or its OBDDs
+# can be loaded into an OBDD with OBDD.load.
+
+class OBDDfile():
+
+    MAGIC = b'OBDD'
+    VERSION = 1
+    HEADER = '<4sIIII'
+    NODE = '<III'
+    NODESIZE = struct.calcsize(NODE)
+
+    def __init__(self,filename):
+        self.file = open(filename,'rb')
+        self.data = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        magic,version,nvars,nnodes,nroots = struct.unpack_from(OBDDfile.HEADER,self.data,0)
+        if magic != OBDDfile.MAGIC or version != OBDDfile.VERSION:
+            raise ValueError(filename + " is not an OBDD file")
+        offset = struct.calcsize(OBDDfile.HEADER)
+        self.vars = []
+        for i in range(0,nvars):
+            (length,) = struct.unpack_from('<I',self.data,offset)
+            offset = offset + 4
+            self.vars.append(bytes(self.data[offset:offset+length]).decode('utf-8'))
+            offset = offset + length
+        self.roots = list(struct.unpack_from('<' + str(nroots) + 'I',self.data,offset))
+        self.nodeOffset = offset + 4 * nroots
+        self.nodeCount = nnodes
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Number of non-terminal nodes in the file
+
+    def __len__(self):
+        return self.nodeCount
+
+    # The level of the variable, and the positive and negative edges,
+    # of node n >= 2
+
+    def node(self,n):
+        return struct.unpack_from(OBDDfile.NODE,self.data,self.nodeOffset + OBDDfile.NODESIZE * (n-2))
+
+    # Truth-value of root r under an assignment (a dictionary from
+    # the variables to 0 and 1), following one path in the file.
+
+    def evaluate(self,r,assignment):
+        e = self.roots[r]
+        negated = 0
+        while (e >> 1) >= 2:
+            negated = negated ^ (e & 1)
+            v,e1,e0 = self.node(e >> 1)
+            e = e1 if assignment[self.vars[v]] else e0
+        return (e >> 1) ^ (e & 1) ^ negated
+
+# OBDD with the nodes stored in parallel arrays instead of objects.
+#
+# A node is a plain integer: 0 and 1 are the terminal nodes as in OBDD,
+# and every non-terminal node i >= 2 is described by
+#    nodeVar[i]  : the index of the variable of the node
+#    posChild[i] : the node for the sub-OBDD when the variable is true
+#    negChild[i] : the node for the sub-OBDD when the variable is false
+#    modelCount[i] : the model-count of the node
+# The model-counts can be arbitrarily large integers, so they are
+# kept in a list instead of a fixed-width array.
+#
+# The unique table is an open-addressing hash table with linear
+# probing. Its slots are node numbers (-1 for an empty slot), and
+# the keys are looked up directly from the node arrays, so there are
+# no tuples or node objects involved.
+
+class ArrayOBDD():
+
+    def __init__(self,vars,cacheSize=2**18,cachePolicy='lru',lazyCount=False,arrays=True,complement=False,gcThreshold=None,gcGrowth=2.0,reorderThreshold=None,profile=False):
+
+        # The options of OBDD that ArrayOBDD does not implement are
+        # accepted only with their default values.
+
+        unsupported = [ name for name,value,default in [ ("complement",complement,False),
+                                                         ("gcThreshold",gcThreshold,None),
+                                                         ("gcGrowth",gcGrowth,2.0),
+                                                         ("reorderThreshold",reorderThreshold,None),
+                                                         ("profile",profile,False) ]
+                        if value != default ]
+        if unsupported:
+            raise ValueError("arrays=True cannot be combined with " + ', '.join(unsupported))
+
+        self.vars = list(vars)
+
+        self.varIndex = dict()
+        for i in range(0,len(vars)):
+            self.varIndex[vars[i]] = i
+
+        # Node arrays. Entries 0 and 1 are for the terminal nodes.
+
+        self.nodeVar = array('i',[len(vars),len(vars)])
+        self.posChild = array('i',[0,1])
+        self.negChild = array('i',[0,1])
+        self.modelCount = [0,1]
+
+        # Unique table, with a power of 2 as the number of slots.
+
+        self.slots = array('i',[-1]) * 1024
+        self.mask = 1023
+
+        self.cache = ComputedTable(cacheSize,cachePolicy)
+        self.lazyCount = lazyCount
+
+    def clearCache(self):
+        self.cache.clear()
+
+    def cacheStats(self):
+        return self.cache.stats()
+
+    # Number of non-terminal nodes
+
+    def __len__(self):
+        return len(self.nodeVar) - 2
+
+    # Statistics as in OBDD.stats, with the load factor of the unique table
+
+    def stats(self):
+        counts = [0] * len(self.vars)
+        for node in range(2,len(self.nodeVar)):
+            counts[self.nodeVar[node]] = counts[self.nodeVar[node]] + 1
+        return { "nodes" : len(self),
+                 "slots" : len(self.slots),
+                 "loadFactor" : len(self) / len(self.slots),
+                 "variables" : len(self.vars),
+                 "levels" : list(zip(self.vars,counts)),
+                 "cache" : self.cacheStats() }
+
+    # Slot of node (v,child1,child2) in the unique table
+
+    def slot(self,v,child1,child2):
+        return ((v * 12582917) ^ (child1 * 4256249) ^ (child2 * 741457)) & self.mask
+
+    # Double the size of the unique table when it is 3/4 full.
+
+    def grow(self):
+        self.slots = array('i',[-1]) * (2 * len(self.slots))
+        self.mask = len(self.slots) - 1
+        for node in range(2,len(self.nodeVar)):
+            i = self.slot(self.nodeVar[node],self.posChild[node],self.negChild[node])
+            while self.slots[i] != -1:
+                i = (i + 1) & self.mask
+            self.slots[i] = node
+
+    # Create a new node if one does not already exist. As in OBDD,
+    # a node with identical children is not created.
+
+    def newOBDDnode(self,v,child1,child2):
+        if child1 == child2:
+            return child1
+        i = self.slot(v,child1,child2)
+        while True:
+            node = self.slots[i]
+            if node == -1:
+                break
+            if self.nodeVar[node] == v and self.posChild[node] == child1 and self.negChild[node] == child2:
+                return node
+            i = (i + 1) & self.mask
+        node = len(self.nodeVar)
+        self.nodeVar.append(v)
+        self.posChild.append(child1)
+        self.negChild.append(child2)
+        self.slots[i] = node
+        if self.lazyCount:
+            self.modelCount.append(None)
+        else:
+            self.modelCount.append(self.nodeModelCount(node))
+        if 4 * len(self) > 3 * len(self.slots):
+            self.grow()
+        return node
+
+    # Model-count from the stored counts of the children, as in OBDD.
+
+    def nodeModelCount(self,node):
+        i = self.nodeVar[node]
+        c1 = self.posChild[node]
+        c0 = self.negChild[node]
+        return (self.modelCount[c1] << (self.nodeVar[c1]-i-1)) + (self.modelCount[c0] << (self.nodeVar[c0]-i-1))
+
+    def modelcount(self,b):
+        stack = [b]
+        while stack:
+            node = stack[-1]
+            if self.modelCount[node] is not None:
+                stack.pop()
+                continue
+            missing = [ c for c in (self.posChild[node],self.negChild[node]) if self.modelCount[c] is None ]
+            if missing:
+                stack.extend(missing)
+            else:
+                self.modelCount[node] = self.nodeModelCount(node)
+                stack.pop()
+        return self.modelCount[b]
+
+    def countModels(self,b):
+        return self.modelcount(b) << self.nodeVar[b]
+
+    # The APPLY operation. The node with the smaller variable index is
+    # split; the terminal nodes have the largest index.
+
+    def apply(self,f,b1,b2):
+
+        def expand(task,stack):
+            _,b1,b2 = task
+            if b1 < 2 and b2 < 2:
+                return f(b1,b2)
+
+            key = (f,b1,b2)
+            result = self.cache.lookup(key)
+            if result is not None:
+                return result
+
+            v1 = self.nodeVar[b1]
+            v2 = self.nodeVar[b2]
+            v = min(v1,v2)
+            stack.append((BUILD,key,v,False))
+            if v1 == v2:
+                stack.append((EXPAND,self.negChild[b1],self.negChild[b2]))
+                stack.append((EXPAND,self.posChild[b1],self.posChild[b2]))
+            elif v1 < v2:
+                stack.append((EXPAND,self.negChild[b1],b2))
+                stack.append((EXPAND,self.posChild[b1],b2))
+            else:
+                stack.append((EXPAND,b1,self.negChild[b2]))
+                stack.append((EXPAND,b1,self.posChild[b2]))
+
+        return runTasks(self,(EXPAND,b1,b2),expand)
+
+    def atom(self,a):
+        return self.newOBDDnode(self.varIndex[a],1,0)
+
+    def conj(self,b1,b2):
+        return self.apply(AND,b1,b2)
+
+    def disj(self,b1,b2):
+        return self.apply(OR,b1,b2)
+
+    def neg(self,b):
+        return self.apply(XOR,b,1)
+
+    def impl(self,b1,b2):
+        return self.apply(IMPL,b1,b2)
+
+    def eqvi(self,b1,b2):
+        return self.apply(EQVI,b1,b2)
+
+    # Conjunction and disjunction of a list of OBDDs, with the same
+    # schedules as in OBDD (see OBDD.combine)
+
+    SCHEDULES = OBDD.SCHEDULES
+
+    def conjs(self,bb,schedule='linear',record=False):
+        return self.combine(self.conj,bb,1,0,schedule,record)
+
+    def disjs(self,bb,schedule='linear',record=False):
+        return self.combine(self.disj,bb,0,1,schedule,record)
+
+    combine = OBDD.combine
+
+    # Number of nodes in an OBDD, not counting the terminal nodes,
+    # and the variables occurring in it
+
+    def size(self,b):
+        return len(self.nodes(b))
+
+    def support(self,b):
+        return { self.vars[self.nodeVar[node]] for node in self.nodes(b) }
+
+    def nodes(self,b):
+        visited = set()
+        stack = [b]
+        while stack:
+            node = stack.pop()
+            if node < 2 or node in visited:
+                continue
+            visited.add(node)
+            stack.append(self.posChild[node])
+            stack.append(self.negChild[node])
+        return visited
+
 # Run some tests.
 
 if __name__ == "__main__":
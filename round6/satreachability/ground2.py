@@ -3,6 +3,7 @@
 # Grounding of parametric transition definitions
 #
 
+import itertools
 from logic2 import *
 from effects import *
 
@@ -12,16 +13,15 @@ from effects import *
 # Consider an action with parameters x : {a,b}, y : {c,d}.
 # We need to create all possible value combinations for x and y,
 # and these are represented by the four variable bindings
-# [ (x,a), (y,c) ]
-# [ (x,a), (y,d) ]
-# [ (x,b), (y,c) ]
-# [ (x,b), (y,d) ]
-# The function doallassignments takes the first parameter
-# binds it in all possible ways (e.g. x is bound to 'a' and 'b'),
-# and recursively calls itself for each of these cases, until
-# all variables are bound. The bottom of the recursion is
-# when there are no parameters left to bind, and the 'bindings'
-# variable includes every parameter with one value.
+# { x : a, y : c }
+# { x : a, y : d }
+# { x : b, y : c }
+# { x : b, y : d }
+# The function allbindings goes through the Cartesian product of
+# the sets of values of the parameters with itertools.product, and
+# generates the bindings one by one, each extending the bindings
+# of the parameters of the enclosing expressions (if any). The time
+# needed is linear in the number of the bindings.
 
 # Instantiate a term for given variable bindings, and evaluate
 # all numeric expressions.
@@ -31,40 +31,21 @@ from effects import *
 #   numeric expressions that refer to variables in the bindings
 
 def instTermEval(t,bindings):
-    for e in bindings:
-        k,v = e
-        if k==t:
-            return str(v) # It is a bound variable
     if isinstance(t,str): # If a string is not bound, it's a constant symbol
+        if t in bindings:
+            return str(bindings[t]) # It is a bound variable
         return t
     # Otherwise it is a numeric expression
-    def V(x):
-        for e in bindings:
-            k,v = e
-            if k==x:
-                return v # It is a bound variable
-        return x # It is a constant symbol
-    return str(t.eval(V)) # Evaluate the expression
+    return str(t.eval(lambda x : bindings.get(x,x))) # Evaluate the expression
     
 # Instantiate a term, but do not evaluate anything (as the term
 # may still contain variables with no binding.)
 
 def instTerm(t,bindings):
     if isinstance(t,str): # The term is possibly a var with value
-        for e in bindings:
-            k,v = e
-            if k==t:
-                return v
-        # Has not value. Return as is.
-        return t
+        return bindings.get(t,t) # If no value, return as is
     # Otherwise it is a numeric expression
-    def V(x):
-        for e in bindings:
-            k,v = e
-            if k==x:
-                return v # It is a bound variable
-        return x # It is a constant symbol
-    return t.varmap(V) # Substitute all bound variables
+    return t.varmap(lambda x : bindings.get(x,x)) # Substitute all bound variables
     
 # Instantiate an atom for given variable bindings, and evaluate
 # possible numeric expressions in the terms.
@@ -73,33 +54,44 @@ def instTerm(t,bindings):
 
 def instAtom(a,bindings):
     pred,termlist = a
-#    itermlist = map( (lambda t : instTerm(t,bindings)), termlist)
     itermlist = [ instTerm(t,bindings) for t in termlist ]
     return (pred,itermlist)
 
-# Instantiate an expression, with all possible variable bindings
+# Generate all variable bindings for the parameters, extending the
+# given bindings
+
+def allbindings(params,bindings):
+    names = [ var for var,values in params ]
+    for values in itertools.product(*[ values for var,values in params ]):
+        b = dict(bindings)
+        b.update(zip(names,values))
+        yield b
+
+# Instantiate an expression, with all possible variable bindings.
+# The bindings (a dictionary, or a list of pairs) are for the parameters
+# of enclosing expressions. The bindings of the instances are updated
+# in place, so that the same function for instantiating the atoms is
+# used for all instances.
 
 def allExprInstances(params,expr,bindings):
-    # If all parameters have a value, instantiate with these parameter values
-    if params == []:
-        return [expr.varmap( (lambda a : instAtom(a,bindings)) )]
-    # Otherwise go through all values for the first parameter, with recursive calls
-    param,*params2 = params
-    var,values = param
-    result = [ allExprInstances(params2,expr,bindings + [(var,val)]) for val in values ]
-    return sum(result,[])
+    current = dict(bindings)
+    M = (lambda a : instAtom(a,current))
+    result = []
+    for b in allbindings(params,bindings):
+        current.update(b)
+        result.append(expr.varmap(M))
+    return result
 
 # Instantiate an effect, with all possible variable bindings
 
 def allEffectInstances(params,effect,bindings):
-    # If all parameters have a value, instantiate with these parameter values
-    if params == []:
-        return [ effect.varmap( (lambda a : instAtom(a,bindings)) ) ]
-    # Otherwise go through all values for the first parameter, with recursive calls
-    param,*params2 = params
-    var,values = param
-    result = [ allEffectInstances(params2,effect,bindings + [(var,val)]) for val in values ]
-    return sum(result,[])
+    current = dict(bindings)
+    M = (lambda a : instAtom(a,current))
+    result = []
+    for b in allbindings(params,bindings):
+        current.update(b)
+        result.append(effect.varmap(M))
+    return result
 
 # Instantiate an atom for given variable bindings, and evaluate
 # possible numeric expressions in the terms.
@@ -110,7 +102,6 @@ def instAtomEval2Str(a,bindings):
     pred,termlist = a
     if len(termlist) == 0:
         return pred
-#    itermlist = map( (lambda t : instTermEval(t,bindings)), termlist)
     itermlist = [ instTermEval(t,bindings) for t in termlist ]
     return pred + "_" + '_'.join(itermlist)
 
@@ -119,26 +110,24 @@ def instAtomEval2Str(a,bindings):
 def makeName(actionname,bindings):
     if len(bindings) == 0:
         return actionname
-    return actionname + "_" + '_'.join([ str(b[1]) for b in bindings ])
+    return actionname + "_" + '_'.join([ str(v) for v in bindings.values() ])
 
 # Instantiate an action, with all possible variable bindings, and
-# evaluating all expressions in precondition and effects.
+# evaluating all expressions in precondition and effects. The
+# instances are generated one by one.
 
 def allActionInstances(actionname,params,precon,effect,bindings):
-    # If all parameters have a value, instantiate with these parameter values
-    if params == []:
-        return [(makeName(actionname,bindings),precon.varmap( (lambda a : instAtomEval2Str(a,bindings)) ), effect.varmap( (lambda a : instAtomEval2Str(a,bindings)) ))]
-    # Otherwise go through all values for the first parameter, with recursive calls
-    param,*params2 = params
-    var,values = param
-    result = [ allActionInstances(actionname,params2,precon,effect,bindings + [(var,val)]) for val in values ]
-    return sum(result,[])
+    current = dict(bindings)
+    M = (lambda a : instAtomEval2Str(a,current))
+    for b in allbindings(params,bindings):
+        current.update(b)
+        yield (makeName(actionname,current),precon.varmap(M),effect.varmap(M))
 
 # Grounding of one action, generating all instances
 
 def groundaction(a):
     actionname,params,precon,effect = a
-    return allActionInstances(actionname,params,precon,effect,list())
+    return allActionInstances(actionname,params,precon,effect,dict())
 
 # Top-level procedure for grounding
 
@@ -157,7 +146,7 @@ def actionNumVars(g):
 # Instantiate with the empty bindings
 
 def bareinstantiate(a):
-    return instAtomEval2Str(a,list())
+    return instAtomEval2Str(a,dict())
 
 def groundmodel(source,target,trajectory,actions):
     if target == None: